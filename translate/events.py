@@ -0,0 +1,61 @@
+# Job status events pushed to the browser
+#
+# Workers publish every state change of a translation task on a Redis pub/sub
+# channel of its own; the task_events view (served over ASGI) subscribes to it
+# and streams the changes as Server-Sent Events. Publishing is best effort:
+# clients that miss an event, or cannot hold a stream open, fall back to
+# polling ajax_task_status.
+import json
+import os
+
+# -------- configuration --------
+# Redis used for the pub/sub channels; empty means the Celery broker
+EVENTS_URL = os.environ.get("TASK_EVENTS_URL", "")
+# Seconds between heartbeat events, and the longest a single stream stays open
+EVENTS_HEARTBEAT = float(os.environ.get("TASK_EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_STREAM = float(os.environ.get("TASK_EVENTS_MAX_STREAM", "3600"))
+
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+_client = None
+
+
+def channel(task_id: str) -> str:
+    return f"task-events:{task_id}"
+
+
+def events_url() -> str:
+    """TASK_EVENTS_URL, or the Celery broker when it is not set."""
+    if EVENTS_URL:
+        return EVENTS_URL
+    from django.conf import settings
+
+    return settings.CELERY_BROKER_URL
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(events_url())
+    return _client
+
+
+def publish(task_id: str, state: str, progress: dict = None):
+    """Announce a state change of task_id; never fails the task."""
+    if not task_id or EVENTS_URL.lower() == "off":
+        return
+    try:
+        _get_client().publish(channel(task_id), json.dumps({"state": state, "progress": progress}))
+    except Exception as e:
+        print(f"Could not publish event for task {task_id}: {e}")
+
+
+async def subscribe(task_id: str):
+    """Async pub/sub subscription to task_id's channel (caller closes it)."""
+    import redis.asyncio as aioredis
+
+    client = aioredis.Redis.from_url(events_url())
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel(task_id))
+    return client, pubsub
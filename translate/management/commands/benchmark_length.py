@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+
+import pymupdf
+from docx import Document
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+
+from translate.utils.analysis import measure
+from translate.utils.text_length_calculator import pdf_page_texts
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the document extraction behind price quotes (the analysis artifact) on large synthetic files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdf-pages', type=int, default=500, help='Pages in the synthetic PDF.')
+        parser.add_argument('--rows', type=int, default=50000, help='Rows in the synthetic CSV/XLSX (4 columns).')
+        parser.add_argument('--paragraphs', type=int, default=20000, help='Paragraphs in the synthetic DOCX.')
+
+    def handle(self, *args, **options):
+        line = 'The quick brown fox jumps over the lazy dog near the riverbank.'
+        with tempfile.TemporaryDirectory() as tmp:
+            files = {}
+
+            files['csv'] = os.path.join(tmp, 'bench.csv')
+            with open(files['csv'], 'w', encoding='utf-8') as f:
+                for i in range(options['rows']):
+                    f.write(f'{i},"{line}",Item {i % 500},{i * 1.5}\n')
+
+            files['xlsx'] = os.path.join(tmp, 'bench.xlsx')
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            for i in range(options['rows']):
+                ws.append([i, line, f'Item {i % 500}', f'=A{i + 1}*2'])
+            wb.save(files['xlsx'])
+
+            files['docx'] = os.path.join(tmp, 'bench.docx')
+            doc = Document()
+            for i in range(options['paragraphs']):
+                doc.add_paragraph(f'{i}. {line}')
+            doc.save(files['docx'])
+
+            files['pdf'] = os.path.join(tmp, 'bench.pdf')
+            pdf = pymupdf.open()
+            for i in range(options['pdf_pages']):
+                page = pdf.new_page()
+                page.insert_text((50, 72), '\n'.join(f'{i}.{j} {line}' for j in range(45)), fontsize=9)
+            pdf.save(files['pdf'])
+            pdf.close()
+
+            def pdf_one_process(path):
+                texts = pdf_page_texts(path, workers=1)
+                return sum(len(t) for t in texts), sum(1 for t in texts if t.strip())
+
+            runs = [(kind, path, measure) for kind, path in files.items()]
+            runs.append(('pdf (1 process)', files['pdf'], pdf_one_process))
+            for kind, path, fn in runs:
+                start = time.perf_counter()
+                length, segments = fn(path)
+                elapsed = time.perf_counter() - start
+                size = os.path.getsize(path) / (1024 * 1024)
+                self.stdout.write(f'{kind:<16} {size:7.1f} MB  {length:>12,} chars  {segments:>9,} segments  '
+                                  f'{elapsed:7.3f}s')
@@ -0,0 +1,59 @@
+# Celery queue routing for translation jobs
+#
+# Each job goes to a named queue by file format and estimated size, so a
+# small CSV never waits behind a long pdf2zh run:
+#   fast-tabular  CSV/XLSX up to its max_chars
+#   docx          DOCX up to its max_chars
+#   pdf-heavy     every PDF, and the page ranges of split PDFs
+#   bulk          larger CSV/XLSX/DOCX jobs, their shards, merges and economy batches
+# Queue profiles (size cut-offs, worker concurrency, prefetch and time
+# limits) live in settings.TRANSLATE_QUEUES.
+import os
+from django.conf import settings
+
+FORMAT_QUEUES = {".csv": "fast-tabular", ".xlsx": "fast-tabular", ".docx": "docx", ".pdf": "pdf-heavy"}
+BULK_QUEUE = "bulk"
+
+# Tasks that only exist for big jobs, or mostly wait on the Batch API
+BULK_TASKS = {
+    "translate.tasks.translate_shard_task",
+    "translate.tasks.merge_shards_task",
+    "translate.tasks.merge_pdf_parts_task",
+    "translate.tasks.discard_pdf_parts_task",
+    "translate.tasks.translate_file_batch_task",
+}
+PDF_PART_TASK = "translate.tasks.translate_pdf_part_task"
+
+
+def _text_length(in_path) -> int:
+    # Import here to avoid circular imports
+    from .utils.analysis import get_analysis
+
+    try:
+        return get_analysis(in_path)["text_length"]
+    except Exception as e:
+        print(f"Could not size {in_path} for routing: {e}")
+        return 0
+
+
+def queue_for(in_path) -> str:
+    """Queue of a translate_file_task job for in_path."""
+    queue = FORMAT_QUEUES.get(os.path.splitext(str(in_path))[1].lower())
+    if queue is None:
+        return BULK_QUEUE
+    max_chars = settings.TRANSLATE_QUEUES[queue].get("max_chars")
+    if max_chars is not None and _text_length(in_path) > max_chars:
+        return BULK_QUEUE
+    return queue
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router (CELERY_TASK_ROUTES); other tasks keep the default queue."""
+    if name in BULK_TASKS:
+        return {"queue": BULK_QUEUE}
+    if name == PDF_PART_TASK:
+        return {"queue": FORMAT_QUEUES[".pdf"]}
+    if name == "translate.tasks.translate_file_task":
+        in_path = args[0] if args else kwargs.get("in_path")
+        return {"queue": queue_for(in_path)}
+    return None
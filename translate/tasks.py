@@ -1,19 +1,292 @@
-from celery import shared_task
+import os
+import random
+import threading
+import time
+from celery import chord, group, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import task_postrun
+from . import events
 from .helper import translate_file
+from .translator import validate_file
+from .translators import batch_api, pdf_parts, shards
+from .translators.pdf_translator import translate_pdf
+from .translators.checkpoint import clear_starts, count_start, job_checkpoint
 
-@shared_task
-def translate_file_task(in_path, out_path, src, tgt):
+# Exponential backoff between attempts: 30s, 60s, 120s ... capped, with jitter
+RETRY_BACKOFF = 30
+RETRY_BACKOFF_MAX = 600
+
+# Progress is published with update_state at most this often (seconds)
+PROGRESS_INTERVAL = 2.0
+
+# Tasks are redelivered when their worker dies (reject_on_worker_lost); a
+# document that kills the worker (OOM, segfault) fails after this many lost
+# workers instead of being redelivered forever
+MAX_WORKER_LOSSES = int(os.environ.get("TRANSLATE_MAX_WORKER_LOSSES", "2"))
+
+# Economy mode: how often to look at a submitted batch, and for how long
+BATCH_POLL_INTERVAL = 300
+BATCH_MAX_POLLS = 26 * 3600 // BATCH_POLL_INTERVAL
+
+
+def progress_reporter(task):
+    """Progress callback publishing the job's state as a PROGRESS update.
+
+    Translators call it from their worker threads, so the task id is taken
+    up front and updates are throttled to one per PROGRESS_INTERVAL (plus the
+    final one) to keep the result backend quiet. Segments per second give
+    the job's throughput.
+    """
+    task_id = task.request.id
+    started = time.monotonic()
+    last = [0.0]
+    lock = threading.Lock()
+
+    def report(state):
+        now = time.monotonic()
+        finished = state.get("percent", 0) >= 100
+        with lock:
+            if now - last[0] < PROGRESS_INTERVAL and not finished:
+                return
+            last[0] = now
+        elapsed = now - started
+        meta = dict(state, elapsed=round(elapsed, 1))
+        if "segments_done" in state and elapsed > 0:
+            meta["segments_per_sec"] = round(state["segments_done"] / elapsed, 2)
+        task.update_state(task_id=task_id, state="PROGRESS", meta=meta)
+        events.publish(task_id, "PROGRESS", meta)
+
+    return report
+
+
+def _refuse_after_worker_losses(task):
+    """Fail a task whose earlier deliveries each took their worker down.
+
+    Starts are counted in the checkpoint store and cleared when a run
+    finishes (forget_starts), so only runs that never finished add up.
+    """
+    starts = count_start(task.request.id)
+    if starts > MAX_WORKER_LOSSES + 1:
+        raise Exception(f"Translation failed: the worker stopped {starts - 1} times while translating this file. "
+                        f"It may be too large or damaged.")
+
+
+def _announce(task, meta):
+    task.update_state(state="PROGRESS", meta=meta)
+    events.publish(task.request.id, "PROGRESS", meta)
+
+
+def _shard_fan_out(task, in_path, out_path, src, tgt, concurrency):
+    """Chord translating the document's shards on many workers, or None when
+    the job fits in one shard."""
+    plan = shards.plan(in_path, src, tgt)
+    if len(plan) <= 1:
+        return None
+    _announce(task, {"stage": "sharded", "shards": len(plan)})
+    header = group(translate_shard_task.s(in_path, src, tgt, batches, concurrency) for batches in plan)
+    return chord(header, merge_shards_task.s(in_path, out_path, src, tgt, concurrency))
+
+
+def _pdf_fan_out(task, in_path, out_path, src, tgt):
+    """Chord translating a long PDF's page ranges on many workers."""
+    parts = pdf_parts.split(in_path, out_path)
+    scratch = os.path.dirname(parts[0][0])
+    _announce(task, {"stage": "split", "parts": len(parts)})
+    header = group(translate_pdf_part_task.s(part, part_out, src, tgt, length) for part, part_out, length in parts)
+    merge = merge_pdf_parts_task.s(in_path, out_path, scratch).on_error(discard_pdf_parts_task.si(scratch))
+    return chord(header, merge)
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def translate_file_task(self, in_path, out_path, src, tgt, concurrency=None):
     """ 
     Task wrapper function for translate_file function. 
     Handles errors and provides formatted error messages.
+
+    Finished batches are checkpointed, so a retry or a redelivery after the
+    worker died resumes from the first incomplete batch; after
+    MAX_WORKER_LOSSES dead workers the task fails instead. Documents above
+    TRANSLATE_SHARD_SEGMENTS are split into shards translated by
+    translate_shard_task on many workers and reassembled by
+    merge_shards_task; PDFs of PDF_SPLIT_MIN_PAGES pages or more are split
+    into page ranges the same way. The merge task takes over this task id.
     """
+    _refuse_after_worker_losses(self)
+    checkpoint = job_checkpoint(in_path, src, tgt)
+    fan_out = None
     try:
-        return translate_file(in_path, out_path, src, tgt)
+        if shards.should_shard(in_path):
+            fan_out = _shard_fan_out(self, in_path, out_path, src, tgt, concurrency)
+        elif pdf_parts.should_split(in_path):
+            fan_out = _pdf_fan_out(self, in_path, out_path, src, tgt)
+        if fan_out is None:
+            result = translate_file(in_path, out_path, src, tgt, concurrency=concurrency, checkpoint=checkpoint,
+                                    progress=progress_reporter(self))
     except ValueError as e:
         # Format the error message to be more user-friendly
         if "Invalid MIME" in str(e):
             raise ValueError(f"The file format doesn't match its extension. {str(e)}")
         raise  # Re-raise other ValueError exceptions
+    except SoftTimeLimitExceeded:
+        # past the queue's time limit (settings.TRANSLATE_QUEUES); a retry would hit it again
+        raise
     except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** self.request.retries)
+            raise self.retry(exc=e, countdown=random.uniform(countdown / 2, countdown))
         # Handle other unexpected errors
-        raise Exception(f"Translation failed: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Translation failed: {str(e)}")
+
+    if fan_out is not None:
+        raise self.replace(fan_out)
+
+    if checkpoint is not None:
+        if checkpoint.resumed:
+            print(f"Resumed {checkpoint.resumed} batches from checkpoint")
+        checkpoint.clear()
+    return result
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def translate_shard_task(self, in_path, src, tgt, batches, concurrency=None):
+    """
+    Translate one shard ({batch key: segments}) of a large document.
+
+    Returns the shard's results for merge_shards_task; finished batches are
+    also checkpointed under the job, so a retry resumes mid-shard.
+    """
+    _refuse_after_worker_losses(self)
+    checkpoint = job_checkpoint(in_path, src, tgt)
+    try:
+        return shards.translate_shard(in_path, batches, src, tgt, concurrency, checkpoint)
+    except SoftTimeLimitExceeded:
+        raise
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** self.request.retries)
+            raise self.retry(exc=e, countdown=random.uniform(countdown / 2, countdown))
+        raise Exception(f"Translation failed: {str(e)}")
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def merge_shards_task(self, shard_results, in_path, out_path, src, tgt, concurrency=None):
+    """
+    Chord callback of a sharded translate_file_task: writes the output file
+    from every shard's translations, under the original task id.
+    """
+    _refuse_after_worker_losses(self)
+    try:
+        result = shards.merge(shard_results, in_path, out_path, src, tgt, concurrency)
+    except SoftTimeLimitExceeded:
+        raise
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** self.request.retries)
+            raise self.retry(exc=e, countdown=random.uniform(countdown / 2, countdown))
+        raise Exception(f"Translation failed: {str(e)}")
+    checkpoint = job_checkpoint(in_path, src, tgt)
+    if checkpoint is not None:
+        checkpoint.clear()
+    return result
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def translate_pdf_part_task(self, part_path, part_out_path, src, tgt, text_length=None):
+    """
+    Translate one page range of a split PDF; returns the translated part's path.
+
+    Parts are cut from the validated upload, so they skip translate_file's
+    checks, and their text length comes from the split instead of an
+    analysis of the (temporary) part file.
+    """
+    _refuse_after_worker_losses(self)
+    try:
+        return translate_pdf(part_path, part_out_path, src, tgt, text_length=text_length)
+    except SoftTimeLimitExceeded:
+        raise
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** self.request.retries)
+            raise self.retry(exc=e, countdown=random.uniform(countdown / 2, countdown))
+        raise Exception(f"Translation failed: {str(e)}")
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
+def merge_pdf_parts_task(self, part_outputs, in_path, out_path, scratch):
+    """
+    Chord callback of a split PDF: joins the translated parts in page order
+    into out_path, under the original task id, and removes the part files
+    once the merge succeeded or will not be retried.
+    """
+    _refuse_after_worker_losses(self)
+    try:
+        result = pdf_parts.merge(part_outputs, in_path, out_path)
+    except SoftTimeLimitExceeded:
+        pdf_parts.discard(scratch)
+        raise
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** self.request.retries)
+            raise self.retry(exc=e, countdown=random.uniform(countdown / 2, countdown))
+        pdf_parts.discard(scratch)
+        raise Exception(f"Translation failed: {str(e)}")
+    pdf_parts.discard(scratch)
+    return result
+
+
+@shared_task
+def discard_pdf_parts_task(scratch):
+    """Remove a split PDF's part files after a part failed."""
+    pdf_parts.discard(scratch)
+
+
+@shared_task(bind=True, max_retries=BATCH_MAX_POLLS, acks_late=True, reject_on_worker_lost=True)
+def translate_file_batch_task(self, in_path, out_path, src, tgt, batch_id=None, concurrency=None):
+    """
+    Economy-mode translation of a CSV/XLSX file through the Batch API.
+
+    The first run submits the batch and reschedules itself; later runs poll
+    the batch until it is done and then assemble the output file. The task id
+    stays the same throughout, so status polling works as for the
+    synchronous task. Other formats are translated synchronously.
+    """
+    _refuse_after_worker_losses(self)
+    if not batch_api.supports(in_path):
+        return translate_file(in_path, out_path, src, tgt, concurrency=concurrency)
+
+    if batch_id is None:
+        # same checks translate_file makes, before anything is uploaded
+        try:
+            validate_file(in_path)
+        except ValueError as e:
+            if "Invalid MIME" in str(e):
+                raise ValueError(f"The file format doesn't match its extension. {str(e)}")
+            raise
+        batch_id = batch_api.submit(in_path, src, tgt)
+        if batch_id is None:
+            # everything was passthrough or already in the translation memory
+            return batch_api.collect(None, in_path, out_path, src, tgt, concurrency)
+    elif batch_api.status(batch_id) in batch_api.DONE_STATES:
+        return batch_api.collect(batch_id, in_path, out_path, src, tgt, concurrency)
+
+    # raises MaxRetriesExceededError once the batch has had its 24h window and then some
+    raise self.retry(kwargs={"batch_id": batch_id, "concurrency": concurrency}, countdown=BATCH_POLL_INTERVAL)
+
+
+@task_postrun.connect
+def publish_final_state(sender=None, task_id=None, state=None, **kwargs):
+    """Push SUCCESS/FAILURE/RETRY of translation tasks to status streams.
+
+    task_postrun fires after the result is stored, so listeners reading the
+    result backend on this event see the final state.
+    """
+    if sender in (translate_file_task, translate_file_batch_task, merge_shards_task, merge_pdf_parts_task):
+        events.publish(task_id, state)
+
+
+@task_postrun.connect
+def forget_starts(sender=None, task_id=None, **kwargs):
+    """A run that got this far did not take its worker down (see MAX_WORKER_LOSSES)."""
+    if sender in (translate_file_task, translate_shard_task, merge_shards_task, translate_pdf_part_task,
+                  merge_pdf_parts_task, translate_file_batch_task):
+        clear_starts(task_id)
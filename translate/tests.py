@@ -1,3 +1,754 @@
-from django.test import TestCase
+import csv
+import email.utils
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import docx
+import httpx
+import openai
+import pymupdf
+from openpyxl import load_workbook, Workbook
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncRequestFactory, override_settings, RequestFactory, SimpleTestCase
+
+from translator import celery as celery_config
+
+from . import events, tasks, views3
+from .translators import batch_api, cells, checkpoint, llm_client, memory, ooxml, pdf_engine, pdf_parts, \
+    pdf_translator, rate_limit, shards, utils
+from .translators.csv_translator import translate_csv
+from .translators.docx_translator import translate_docx, translate_docx_chunk
+from .translators.passthrough import classify
+from .translators.pdf_translator import _governed_progress
+from .translators.utils import MAX_INPUT_TOKENS, MODEL, PARA_DELIM, RUN_DELIM
+from .translators.xlsx_sst_translator import translate_xlsx_sst
+from .translators.xlsx_translator import translate_xlsx
+from .utils import analysis, cost_estimator, pdf_preflight
+from .utils.text_length_calculator import pdf_page_texts
+
+
+class FakeChat:
+    """Stands in for the OpenAI client: "translates" every segment with
+    `translate` (upper-casing by default) and records each request."""
+
+    def __init__(self, translate=str.upper):
+        self.translate = translate
+        self.requests = []
+        self.usage = None  # token usage attached to every reply
+        self.errors = []  # raised, in order, by the next requests instead of a reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def sent(self) -> list:
+        """Every segment sent to the model, in request order."""
+        texts = []
+        for kwargs in self.requests:
+            content = kwargs["messages"][-1]["content"]
+            if kwargs.get("tools"):
+                texts.extend(t for _, t in self._pairs(content))
+            else:
+                texts.extend(content.split(PARA_DELIM))
+        return texts
+
+    @staticmethod
+    def _pairs(content):
+        if content.startswith("Note: "):
+            content = content.split("\n", 1)[1]
+        return json.loads(content)
+
+    def reply(self, kwargs):
+        content = kwargs["messages"][-1]["content"]
+        if kwargs.get("tools"):
+            items = [{"i": i, "t": self.translate(t)} for i, t in self._pairs(content)]
+            call = SimpleNamespace(type="function", function=SimpleNamespace(
+                name="return_translations", arguments=json.dumps({"items": items})))
+            return SimpleNamespace(tool_calls=[call], content=None)
+        paragraphs = [RUN_DELIM.join(self.translate(run) for run in p.split(RUN_DELIM))
+                      for p in content.split(PARA_DELIM)]
+        return SimpleNamespace(tool_calls=None, content=PARA_DELIM.join(paragraphs))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=self.reply(kwargs))], usage=self.usage)
+
+
+class TranslatorTestCase(SimpleTestCase):
+    """Runs the translators against FakeChat with the translation memory off
+    and analysis artifacts in a scratch directory."""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.tmp), True)
+        self.fake = FakeChat()
+        for target, attribute, value in ((llm_client, "_client", self.fake), (memory, "_memory", False),
+                                         (analysis, "ANALYSIS_DIR", self.tmp / "analysis")):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, name, text) -> Path:
+        path = self.tmp / name
+        path.write_text(text, encoding="utf-8")
+        return path
+
+
+class CsvTranslatorTests(TranslatorTestCase):
+    SEMICOLON_CSV = "name;price\nRed, ripe apple;1.50\nPear;2.00\n"
+
+    def test_semicolon_csv_keeps_its_dialect(self):
+        path = self.write("in.csv", self.SEMICOLON_CSV)
+        out = self.tmp / "out.csv"
+        translate_csv(path, out, "English", "German", streaming=False)
+
+        with open(out, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f, delimiter=";"))
+        self.assertEqual(rows, [["NAME", "PRICE"], ["RED, RIPE APPLE", "1.50"], ["PEAR", "2.00"]])
+        self.assertNotIn("1.50", self.fake.sent())
+
+    def test_single_column_text_is_not_split_on_a_letter(self):
+        path = self.write("in.csv", "Hello world\nGood morning\nThank you very much\n")
+        for streaming in (False, True):
+            self.fake.requests.clear()
+            out = self.tmp / f"out-{streaming}.csv"
+            translate_csv(path, out, "English", "German", streaming=streaming)
+            self.assertEqual(sorted(self.fake.sent()), ["Good morning", "Hello world", "Thank you very much"])
+            self.assertEqual(out.read_text(encoding="utf-8").splitlines(),
+                             ["HELLO WORLD", "GOOD MORNING", "THANK YOU VERY MUCH"])
+
+    def test_priced_segments_are_whole_cells(self):
+        text = "Hello world\nGood morning\nThank you very much\n"
+        path = self.write("in.csv", text)
+        data = analysis.analyze(path)
+        self.assertEqual(list(analysis.iter_segments(path)), ["Hello world", "Good morning", "Thank you very much"])
+        self.assertEqual(data["text_length"], len(text))
+        self.assertNotIn("segments", data)
+
+    def test_streaming_and_in_memory_paths_agree(self):
+        path = self.write("in.csv", self.SEMICOLON_CSV)
+        translate_csv(path, self.tmp / "memory.csv", "English", "German", streaming=False)
+        translate_csv(path, self.tmp / "stream.csv", "English", "German", streaming=True)
+        self.assertEqual((self.tmp / "memory.csv").read_text(encoding="utf-8").splitlines(),
+                         (self.tmp / "stream.csv").read_text(encoding="utf-8").splitlines())
+
+
+class PassthroughTests(SimpleTestCase):
+    def assertKinds(self, expected: dict):
+        self.assertEqual(dict(zip(expected, classify(list(expected)))), expected)
+
+    def test_amounts_and_identifiers_pass_through(self):
+        self.assertKinds({"$1,200.50": "currency", "1.200 EUR": "currency", "USD 30": "currency",
+                          "30 €": "currency", "getValue": "code", "user_id": "code", "print(x, y)": "code",
+                          "SKU-100": "id"})
+
+    def test_product_names_and_units_are_text(self):
+        self.assertKinds({"iPhone": "text", "eBay": "text", "macOS": "text", "100 PCS": "text",
+                          "ABC 12": "text", "Total(incl. VAT)": "text"})
+
+
+class CellChunkTests(TranslatorTestCase):
+    def test_missing_items_are_asked_again_and_unknown_ones_ignored(self):
+        first = [True]
+
+        def reply(kwargs):
+            message = FakeChat.reply(self.fake, kwargs)
+            if first[0]:
+                # drop the last item and add one that was never asked for
+                first[0] = False
+                data = json.loads(message.tool_calls[0].function.arguments)
+                data["items"] = data["items"][:-1] + [{"i": 99, "t": "stray"}]
+                message.tool_calls[0].function.arguments = json.dumps(data)
+            return message
+
+        self.fake.reply = reply
+        self.assertEqual(cells.translate_chunk(["one", "two", "3"], "English", "German"), ["ONE", "TWO", "3"])
+        self.assertEqual(self.fake.sent(), ["one", "two", "two"])
+
+
+class CostEstimateTests(TranslatorTestCase):
+    # the sku column is all IDs but one cell, so the translator skips it whole
+    SKU_CSV = "sku,name\n" + "".join(f"AB-{100 + i},Item number {i}\n" for i in range(10)) + "see note,Last item\n"
+
+    def test_csv_estimate_sends_what_the_translator_sends(self):
+        path = self.write("in.csv", self.SKU_CSV)
+        estimate = cost_estimator.estimate_cost(path, "English", "German")
+        translate_csv(path, self.tmp / "out.csv", "English", "German", streaming=False)
+
+        self.assertNotIn("see note", self.fake.sent())
+        self.assertEqual(estimate["sent_segments"], len(set(self.fake.sent())))
+        self.assertEqual(estimate["requests"], len(self.fake.requests))
+
+    def test_estimate_is_counted_once_per_artifact_and_language_pair(self):
+        path = self.write("in.csv", self.SKU_CSV)
+        with mock.patch.object(cost_estimator, "_count", wraps=cost_estimator._count) as count:
+            first = cost_estimator.estimate_cost(path, "English", "German")
+            self.assertEqual(cost_estimator.estimate_cost(path, "English", "German"), first)
+            cost_estimator.estimate_cost(path, "English", "French")
+        self.assertEqual(count.call_count, 2)
+
+
+class ShardTests(TranslatorTestCase):
+    CSV = "sku,name\n" + "".join(f"AB-{100 + i},Item number {i % 12}\n" for i in range(30))
+
+    def test_merged_shards_match_a_single_run_without_new_requests(self):
+        path = self.write("in.csv", self.CSV)
+        with mock.patch.object(utils, "MAX_BATCH_ITEMS", 4):
+            plan = shards.plan(path, "English", "German", shard_segments=8)
+            self.assertGreater(len(plan), 1)
+            results = [shards.translate_shard(path, batches, "English", "German") for batches in plan]
+            planned = self.fake.sent()
+            self.fake.requests.clear()
+
+            shards.merge(results, path, self.tmp / "merged.csv", "English", "German")
+            self.assertEqual(self.fake.requests, [])
+            translate_csv(path, self.tmp / "single.csv", "English", "German")
+        self.assertEqual(sorted(planned), sorted(self.fake.sent()))
+        self.assertEqual((self.tmp / "merged.csv").read_text(encoding="utf-8"),
+                         (self.tmp / "single.csv").read_text(encoding="utf-8"))
+
+
+class XlsxTranslatorTests(TranslatorTestCase):
+    def test_concurrent_batches_land_in_their_own_cells(self):
+        words = [f"word{chr(97 + n)}" for n in range(12)]
+        wb = Workbook()
+        for n, word in enumerate(words):
+            wb.active.cell(n + 1, 1, word)
+            wb.active.cell(n + 1, 2, f"=LEN(A{n + 1})")
+        path, out = self.tmp / "in.xlsx", self.tmp / "out.xlsx"
+        wb.save(str(path))
+
+        with mock.patch.object(utils, "MAX_BATCH_ITEMS", 2):
+            translate_xlsx(path, out, "English", "German", concurrency=4, engine="openpyxl")
+
+        ws = load_workbook(str(out)).active
+        self.assertEqual([ws.cell(n + 1, 1).value for n in range(12)], [w.upper() for w in words])
+        self.assertEqual(ws.cell(1, 2).value, "=LEN(A1)")
+        self.assertEqual(len(self.fake.requests), 6)
+
+
+class XlsxSharedStringsTests(TranslatorTestCase):
+    MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    SST = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<sst xmlns="{MAIN}" count="3">'
+           '<si><t>Hello</t></si>'
+           '<si><r><rPr><b/></rPr><t>Bold</t></r><r><t xml:space="preserve"> plain</t></r></si>'
+           '<si><t>=SUM(A1)</t></si></sst>')
+    SHEET = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{MAIN}"><sheetData>'
+             '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>Inline</t></is></c></row>'
+             '</sheetData></worksheet>')
+
+    def build(self) -> Path:
+        path = self.tmp / "in.xlsx"
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("xl/sharedStrings.xml", self.SST)
+            z.writestr("xl/worksheets/sheet1.xml", self.SHEET)
+            z.writestr("docProps/app.xml", "<Properties/>")
+        return path
+
+    def translate(self) -> dict:
+        out = self.tmp / "out.xlsx"
+        translate_xlsx_sst(self.build(), out, "English", "German")
+        with zipfile.ZipFile(out) as z:
+            return {name: z.read(name).decode("utf-8") for name in z.namelist()}
+
+    def test_rich_text_runs_are_translated_separately(self):
+        sst = self.translate()["xl/sharedStrings.xml"]
+        self.assertIn("<r><rPr><b/></rPr><t>BOLD</t></r><r><t xml:space=\"preserve\"> PLAIN</t></r>", sst)
+        self.assertIn("<si><t>HELLO</t></si>", sst)
+        self.assertIn("<si><t>=SUM(A1)</t></si>", sst)
+        self.assertNotIn("=SUM(A1)", self.fake.sent())
+
+    def test_namespaces_are_declared_once(self):
+        parts = self.translate()
+        self.assertEqual(parts["xl/sharedStrings.xml"].count("xmlns="), 1)
+        self.assertEqual(parts["xl/worksheets/sheet1.xml"].count("xmlns="), 1)
+        self.assertIn("<is><t>INLINE</t></is>", parts["xl/worksheets/sheet1.xml"])
+
+    def test_untouched_entries_survive_without_raw_copy(self):
+        with mock.patch.object(ooxml, "_can_copy_raw", return_value=False):
+            parts = self.translate()
+        self.assertEqual(parts["docProps/app.xml"], "<Properties/>")
+        self.assertIn("<si><t>HELLO</t></si>", parts["xl/sharedStrings.xml"])
+
+
+class DocxChunkTests(TranslatorTestCase):
+    def split_good_day(self, text):
+        # the model answers "Good day" as two paragraphs
+        return PARA_DELIM.join(text.upper().split()) if text == "Good day" else text.upper()
+
+    def test_joined_fallback_is_not_remembered(self):
+        tm = memory.TranslationMemory(memory._SQLiteStore(str(self.tmp / "tm.sqlite3"), 1000))
+        self.fake.translate = self.split_good_day
+        with mock.patch.object(memory, "_memory", tm):
+            out = translate_docx_chunk(["Hello", "Good day"], "English", "German")
+        self.assertEqual(out, ["HELLO", "GOOD DAY"])
+        self.assertEqual(tm.lookup(["Hello", "Good day"], "English", "German", MODEL), {0: "HELLO"})
+
+
+API_ERRORS = {400: openai.BadRequestError, 401: openai.AuthenticationError, 429: openai.RateLimitError,
+              503: openai.InternalServerError}
+
+
+def api_error(status: int, **headers):
+    """The OpenAI SDK's exception for an HTTP `status` answer with `headers`."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return API_ERRORS[status](f"HTTP {status}", response=response, body=None)
+
+
+class RetryTests(TranslatorTestCase):
+    MESSAGES = [{"role": "user", "content": "Hello"}]
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(llm_client.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transient_errors_are_retryable(self):
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        for error in (api_error(429), api_error(503), openai.APITimeoutError(request),
+                      openai.APIConnectionError(request=request)):
+            self.assertTrue(llm_client.is_retryable(error), error)
+        for error in (api_error(400), api_error(401), ValueError("bad payload")):
+            self.assertFalse(llm_client.is_retryable(error), error)
+
+    def test_retry_after_headers(self):
+        self.assertEqual(llm_client.retry_after(api_error(429, **{"retry-after": "3"})), 3.0)
+        self.assertEqual(llm_client.retry_after(api_error(429, **{"retry-after": "3", "retry-after-ms": "250"})), 0.25)
+        when = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(llm_client.retry_after(api_error(429, **{"retry-after": when})), 30, delta=2)
+        self.assertIsNone(llm_client.retry_after(api_error(429)))
+
+    def test_rate_limited_request_waits_and_is_retried(self):
+        self.fake.errors = [api_error(429, **{"retry-after": "7"})]
+        r = llm_client.chat_completion(messages=self.MESSAGES)
+        self.assertEqual(r.choices[0].message.content, "HELLO")
+        self.assertEqual(len(self.fake.requests), 2)
+        self.sleep.assert_called_once_with(7.0)
+
+    def test_bad_request_is_raised_at_once(self):
+        self.fake.errors = [api_error(400)]
+        with self.assertRaises(openai.BadRequestError):
+            llm_client.chat_completion(messages=self.MESSAGES)
+        self.assertEqual(len(self.fake.requests), 1)
+        self.sleep.assert_not_called()
+
+    def test_gives_up_after_max_attempts(self):
+        self.fake.errors = [api_error(503) for _ in range(5)]
+        with mock.patch.object(llm_client, "MAX_ATTEMPTS", 3), self.assertRaises(openai.InternalServerError):
+            llm_client.chat_completion(messages=self.MESSAGES)
+        self.assertEqual(len(self.fake.requests), 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+
+class UsageTests(TranslatorTestCase):
+    def test_each_job_reports_its_own_tokens(self):
+        self.fake.usage = SimpleNamespace(prompt_tokens=10, completion_tokens=4, prompt_tokens_details=None)
+        path = self.write("in.csv", "Hello\nWorld\n")
+        reports = []
+        with mock.patch.dict(llm_client._usage, requests=7, prompt_tokens=70, cached_tokens=0, completion_tokens=28):
+            for job in range(2):
+                with mock.patch("builtins.print") as printed:
+                    translate_csv(path, self.tmp / f"out-{job}.csv", "English", "German", streaming=bool(job))
+                reports.append(next(c.args[0] for c in printed.call_args_list if c.args[0].startswith("[LLM] CSV")))
+        for report in reports:
+            self.assertIn("'requests': 1, 'prompt_tokens': 10, 'cached_tokens': 0, 'completion_tokens': 4", report)
+
+
+class TranslationMemoryTests(TranslatorTestCase):
+    def test_keys_keep_inner_whitespace(self):
+        tm = memory.TranslationMemory(memory._SQLiteStore(str(self.tmp / "tm.sqlite3"), 1000))
+        tm.store_many([("Line one\nLine two", "Zeile eins\nZeile zwei")], "English", "German", MODEL)
+        found = tm.lookup(["Line one Line two", "Line one  Line two", " Line one\nLine two "], "English", "German",
+                          MODEL)
+        self.assertEqual(found, {2: " Zeile eins\nZeile zwei "})
+
+
+class DocxXmlEngineTests(TranslatorTestCase):
+    def test_body_tables_and_headers_are_translated_once_each(self):
+        document = docx.Document()
+        document.sections[0].header.paragraphs[0].text = "Quarterly report"
+        document.add_paragraph("Hello")
+        document.add_table(rows=1, cols=2).rows[0].cells[0].text = "Hello"
+        paragraph = document.add_paragraph("Bold")
+        paragraph.runs[0].bold = True
+        paragraph.add_run(" plain")
+        path, out = self.tmp / "in.docx", self.tmp / "out.docx"
+        document.save(str(path))
+
+        translate_docx(str(path), str(out), "English", "German", engine="xml")
+
+        result = docx.Document(str(out))
+        self.assertEqual(result.sections[0].header.paragraphs[0].text, "QUARTERLY REPORT")
+        self.assertEqual(result.tables[0].rows[0].cells[0].text, "HELLO")
+        self.assertEqual([r.text for r in result.paragraphs[-1].runs], ["BOLD", " PLAIN"])
+        self.assertTrue(result.paragraphs[-1].runs[0].bold)
+        self.assertEqual(sorted(self.fake.sent()), sorted(["Quarterly report", "Hello", f"Bold{RUN_DELIM} plain"]))
+
+
+class WorkerLossTests(TranslatorTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(checkpoint, "_store", lambda: checkpoint._FileStore(str(self.tmp / "ckpt")))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_task_fails_after_too_many_lost_workers(self):
+        # every earlier start died without finishing
+        for _ in range(tasks.MAX_WORKER_LOSSES + 1):
+            checkpoint.count_start("job-1")
+        path = self.write("in.csv", "Hello\n")
+        with mock.patch.object(tasks, "translate_file") as translate_file:
+            result = tasks.translate_file_task.apply((str(path), str(self.tmp / "out.csv"), "en", "de"),
+                                                     task_id="job-1")
+        self.assertEqual(result.state, "FAILURE")
+        self.assertIn("worker stopped", str(result.result))
+        translate_file.assert_not_called()
+
+    def test_finished_runs_do_not_count(self):
+        path = self.write("in.csv", "Hello\n")
+        with mock.patch.object(tasks, "translate_file", return_value="out.csv"):
+            for _ in range(tasks.MAX_WORKER_LOSSES + 2):
+                result = tasks.translate_file_task.apply((str(path), str(self.tmp / "out.csv"), "en", "de"),
+                                                         task_id="job-2")
+                self.assertEqual(result.state, "SUCCESS")
+        self.assertEqual(checkpoint.count_start("job-2"), 1)
+
+
+class SplitPdfTests(TranslatorTestCase):
+    """Split, per-part translation and merge of a long PDF, with pdf2zh
+    replaced by a stream that "translates" a part by copying it."""
+
+    def setUp(self):
+        super().setUp()
+        self.charged = []
+        governor = SimpleNamespace(acquire=self.charged.append)
+        for target, attribute, value in ((checkpoint, "_store", lambda: checkpoint._FileStore(str(self.tmp / "ckpt"))),
+                                         (pdf_parts, "PDF_PAGES_PER_PART", 2),
+                                         (pdf_engine, "is_warm", lambda: False),
+                                         (pdf_translator, "get_governor", lambda: governor),
+                                         (pdf_translator, "do_translate_async_stream", self.copying_stream)):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # pdf2zh's settings are built with the key even though nothing is sent
+        patcher = mock.patch.dict(os.environ, OPENAI_API_KEY="test-key")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def copying_stream(settings, pdf_path):
+        shutil.copy(str(pdf_path), os.path.join(settings.translation.output, "part.mono.pdf"))
+        yield {"type": "progress_update", "overall_progress": 100}
+        yield {"type": "finish", "translate_result": None}
+
+    def make_pdf(self, pages: int) -> Path:
+        doc = pymupdf.open()
+        for n in range(pages):
+            doc.new_page().insert_text((72, 72), f"Page {n} says hello")
+        path = self.tmp / "long.pdf"
+        doc.save(str(path))
+        doc.close()
+        return path
+
+    def test_parts_are_governed_without_analysing_them(self):
+        path = self.make_pdf(5)
+        out = self.tmp / "long.de.pdf"
+        parts = pdf_parts.split(path, out)
+        self.assertEqual(sum(length for _, _, length in parts), sum(len(t) for t in pdf_page_texts(str(path))))
+
+        outputs = []
+        for part, part_out, length in parts:
+            result = tasks.translate_pdf_part_task.apply((part, part_out, "English", "German", length))
+            self.assertEqual(result.state, "SUCCESS", result.result)
+            outputs.append(result.result)
+        self.assertFalse((self.tmp / "analysis").exists())
+        self.assertEqual(sum(self.charged), sum(n // 4 + int(n // 4 * utils.OUTPUT_RATIO) for _, _, n in parts))
+
+        scratch = os.path.dirname(parts[0][0])
+        result = tasks.merge_pdf_parts_task.apply((outputs, str(path), str(out), scratch))
+        self.assertEqual(result.state, "SUCCESS", result.result)
+        self.assertEqual(pdf_page_texts(str(out)), pdf_page_texts(str(path)))
+        self.assertFalse(os.path.exists(scratch))
+
+
+class CheckpointResumeTests(TranslatorTestCase):
+    WORDS = ["apple", "pear", "plum", "fig", "kiwi", "lime"]
+
+    def test_retry_resends_only_unfinished_batches(self):
+        path = self.write("in.csv", "".join(f"{w}\n" for w in self.WORDS))
+        out = self.tmp / "out.csv"
+        job = checkpoint.JobCheckpoint(checkpoint._FileStore(str(self.tmp / "ckpt")), "job-1")
+        create = self.fake.create
+
+        def failing_create(**kwargs):
+            if len(self.fake.requests) == 2:
+                raise RuntimeError("connection reset")
+            return create(**kwargs)
+
+        with mock.patch.object(utils, "MAX_BATCH_ITEMS", 2):
+            with mock.patch.object(self.fake.chat.completions, "create", failing_create):
+                with self.assertRaises(RuntimeError):
+                    translate_csv(path, out, "English", "German", concurrency=1, checkpoint=job)
+            sent_before = self.fake.sent()
+            self.fake.requests.clear()
+            translate_csv(path, out, "English", "German", concurrency=1, checkpoint=job)
+
+        # batches of two: the first two finished before the failure
+        self.assertEqual(job.resumed, 2)
+        self.assertEqual(sent_before, self.WORDS[:4])
+        self.assertEqual(self.fake.sent(), self.WORDS[4:])
+        self.assertEqual(out.read_text(encoding="utf-8").split(), [w.upper() for w in self.WORDS])
+
+
+class QueueWorkerProfileTests(SimpleTestCase):
+    def start_worker(self, **options):
+        """A worker built the way `celery worker -Q ...` builds it (unset options
+        arrive as their configured values), without starting it."""
+        app = celery_config.app
+        options = dict({"prefetch_multiplier": app.conf.worker_prefetch_multiplier, "pool_cls": "solo"}, **options)
+        for key in ("worker_concurrency", "task_soft_time_limit", "task_time_limit"):
+            self.addCleanup(setattr, app.conf, key, getattr(app.conf, key))
+        with mock.patch.object(celery_config, "warm_pdf_engine", lambda queues, pool: None), \
+                warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # running as root in CI
+            return app.Worker(**options)
+
+    def test_worker_gets_its_queue_profile(self):
+        worker = self.start_worker(queues=["docx"])
+        profile = settings.TRANSLATE_QUEUES["docx"]
+        self.assertEqual(worker.prefetch_multiplier, profile["prefetch_multiplier"])
+        self.assertEqual(worker.concurrency, profile["concurrency"])
+        self.assertEqual(worker.consumer.initial_prefetch_count,
+                         profile["prefetch_multiplier"] * profile["concurrency"])
+
+    def test_command_line_wins_over_the_profile(self):
+        worker = self.start_worker(queues=["docx"], prefetch_multiplier=8, concurrency=2)
+        self.assertEqual((worker.prefetch_multiplier, worker.concurrency), (8, 2))
+
+
+class RateGovernorTests(SimpleTestCase):
+    def test_urls_default_to_the_celery_broker(self):
+        with mock.patch.object(events, "EVENTS_URL", ""), mock.patch.object(rate_limit, "RATE_LIMIT_URL", ""), \
+                self.settings(CELERY_BROKER_URL="redis://broker:6379/3"):
+            self.assertEqual(events.events_url(), "redis://broker:6379/3")
+            self.assertEqual(rate_limit.rate_limit_url(), "redis://broker:6379/3")
+        with mock.patch.object(events, "EVENTS_URL", "redis://events:6379/0"):
+            self.assertEqual(events.events_url(), "redis://events:6379/0")
+
+    def test_pdf2zh_requests_are_governed_one_by_one(self):
+        governor, inner = mock.Mock(), mock.Mock()
+        limiter = rate_limit.GovernedRateLimiter(governor, inner, output_ratio=1.5, overhead=100)
+        limiter.wait({"paragraph_token_count": 300})
+        limiter.wait(None)
+        self.assertEqual([c.args[0] for c in governor.acquire.call_args_list], [1000, 250])
+        self.assertEqual(inner.wait.call_count, 2)
+
+    def test_subprocess_pdfs_pay_in_bounded_slices(self):
+        governor, progress = mock.Mock(), mock.Mock()
+        report = _governed_progress(governor, 20000, progress)
+        report({"percent": 0})
+        self.assertFalse(governor.acquire.called)
+        report({"percent": 50})
+        report({"percent": 100})
+        slices = [c.args[0] for c in governor.acquire.call_args_list]
+        self.assertEqual(sum(slices), 20000)
+        self.assertTrue(all(0 < s <= MAX_INPUT_TOKENS for s in slices))
+        self.assertEqual(progress.call_count, 3)
+
+
+class FakePubSub:
+    """Async pub/sub stand-in replaying `messages` (None meaning a silent wait)."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=None):
+        return self.messages.pop(0) if self.messages else None
+
+    async def aclose(self):
+        pass
+
+
+class TaskEventsTests(SimpleTestCase):
+    USER = SimpleNamespace(is_authenticated=True)
+
+    def get(self, factory):
+        request = factory.get("/upload/events/job-1/")
+        request.user = self.USER
+
+        async def auser():
+            return self.USER
+
+        request.auser = auser
+        return request
+
+    def test_wsgi_requests_are_told_to_poll(self):
+        request = self.get(RequestFactory())
+        self.assertEqual(async_to_sync(views3.task_events)(request, "job-1").status_code, 204)
+
+    def test_asgi_stream_sends_heartbeats_until_the_task_finishes(self):
+        pubsub = FakePubSub([None, {"data": json.dumps({"state": "SUCCESS", "progress": None})}])
+
+        async def subscribe(task_id):
+            return pubsub, pubsub
+
+        statuses = iter([({"status": "PENDING"}, 200), ({"status": "SUCCESS"}, 200)])
+        request = self.get(AsyncRequestFactory())
+        with mock.patch.object(events, "subscribe", subscribe), \
+                mock.patch.object(views3, "_task_status", lambda task_id: next(statuses)):
+            response = async_to_sync(views3.task_events)(request, "job-1")
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+
+            async def read():
+                return [chunk async for chunk in response.streaming_content]
+
+            body = b"".join(async_to_sync(read)()).decode()
+        self.assertEqual(body, 'data: {"status": "PENDING"}\n\n'
+                               'event: heartbeat\ndata: {}\n\n'
+                               'data: {"status": "SUCCESS"}\n\n')
+
+
+class PdfPreflightTests(TranslatorTestCase):
+    USER = SimpleNamespace(is_authenticated=True)
+    TEXT = "Every page of this report has a selectable text layer. " * 3
+
+    def make_pdf(self, name, pages, **encryption) -> Path:
+        """A PDF with one "text", "image" (no text layer) or "blank" page per entry of pages."""
+        scan = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 40, 40), False)
+        scan.clear_with(180)
+        doc = pymupdf.open()
+        for kind in pages:
+            page = doc.new_page()
+            if kind == "text":
+                page.insert_textbox(page.rect + (50, 50, -50, -50), self.TEXT, fontsize=10)
+            elif kind == "image":
+                page.insert_image(page.rect, pixmap=scan)
+        path = self.tmp / name
+        doc.save(str(path), **encryption)
+        doc.close()
+        return path
+
+    def test_pdfs_are_classified_from_their_pages(self):
+        cases = {
+            "text": ["text"] * 5,
+            "mixed": ["text", "image", "text", "image", "image"],
+            "scanned": ["image"] * 3,
+            "empty": ["blank"] * 3,
+        }
+        for kind, pages in cases.items():
+            with self.subTest(kind):
+                self.assertEqual(pdf_preflight.preflight(self.make_pdf(f"{kind}.pdf", pages))["kind"], kind)
+        encrypted = self.make_pdf("encrypted.pdf", ["text"], encryption=pymupdf.PDF_ENCRYPT_AES_256,
+                                  owner_pw="owner", user_pw="user")
+        self.assertEqual(pdf_preflight.preflight(encrypted)["kind"], "encrypted")
+
+    def post(self, data):
+        request = RequestFactory().post("/upload/", data)
+        request.user = self.USER
+        return request
+
+    def assertRejected(self, response, kind):
+        self.assertEqual(response.status_code, 422)
+        body = json.loads(response.content)
+        self.assertEqual(body["pdf_kind"], kind)
+        self.assertEqual(body["error"], pdf_preflight.MESSAGES[kind])
+
+    def test_uploads_of_scanned_pdfs_are_rejected(self):
+        scanned = self.make_pdf("scan.pdf", ["image"] * 3).read_bytes()
+        with override_settings(MEDIA_ROOT=str(self.tmp / "media")):
+            response = views3.direct_upload(self.post({"file": SimpleUploadedFile("scan.pdf", scanned)}))
+            self.assertRejected(response, "scanned")
+
+            response = views3.chunked_upload(self.post({
+                "chunk": SimpleUploadedFile("blob", scanned), "chunk_number": 0, "total_chunks": 1,
+                "file_name": "scan.pdf", "upload_id": "u1", "chunk_start": 0, "chunk_size": len(scanned)}))
+            self.assertRejected(response, "scanned")
+            self.assertFalse((self.tmp / "media" / "uploads" / "u1_scan.pdf").exists())
+
+    def test_start_translate_refuses_a_rejected_pdf(self):
+        media = self.tmp / "media"
+        (media / "uploads").mkdir(parents=True)
+        shutil.copy(str(self.make_pdf("blank.pdf", ["blank"] * 2)), str(media / "uploads" / "blank.pdf"))
+        with override_settings(MEDIA_ROOT=str(media)):
+            response = views3.start_translate(self.post({
+                "file_path": "uploads/blank.pdf", "source_language": "English", "target_language": "German"}))
+        self.assertRejected(response, "empty")
+
+
+class FakeBatchEndpoint:
+    """Batch API stand-in: answers every uploaded request with FakeChat."""
+
+    def __init__(self, chat):
+        self.chat = chat
+        self.uploads = {}
+        self.files = SimpleNamespace(create=self.create_file, content=self.content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve)
+
+    def create_file(self, file, purpose):
+        self.uploads["input"] = file[1].read().decode("utf-8")
+        return SimpleNamespace(id="input")
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        lines = []
+        for line in self.uploads[input_file_id].splitlines():
+            request = json.loads(line)
+            message = self.chat.reply(request["body"])
+            calls = [{"id": "call", "type": "function",
+                      "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                     for c in message.tool_calls]
+            body = {"id": "cmpl", "object": "chat.completion", "created": 0, "model": "fake",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": None, "tool_calls": calls}}]}
+            lines.append(json.dumps({"custom_id": request["custom_id"],
+                                     "response": {"status_code": 200, "body": body}}))
+        self.uploads["output"] = "\n".join(lines)
+        return SimpleNamespace(id="batch-1")
+
+    def retrieve(self, batch_id):
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id="output")
+
+    def content(self, file_id):
+        return SimpleNamespace(text=self.uploads[file_id])
+
+
+class BatchApiTests(TranslatorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.endpoint = FakeBatchEndpoint(FakeChat())
+        for target, attribute, value in ((batch_api, "get_batch_client", lambda: self.endpoint),
+                                         (checkpoint, "_store",
+                                          lambda: checkpoint._FileStore(str(self.tmp / "ckpt")))):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_submit_and_collect_through_the_batch_endpoint(self):
+        path = self.write("in.csv", "name,qty\nApple,1\nPear,2\nApple,3\n")
+        out = self.tmp / "out.csv"
+        with mock.patch.object(batch_api, "_record", wraps=batch_api._record) as record:
+            batch_id = batch_api.submit(path, "English", "German")
+            self.assertEqual(batch_api.status(batch_id), "completed")
+            batch_api.collect(batch_id, path, out, "English", "German")
+        self.assertEqual(record.call_count, 1)
+        self.assertEqual(self.fake.requests, [])  # nothing was translated synchronously
+        self.assertEqual(out.read_text(encoding="utf-8").splitlines(), ["NAME,QTY", "APPLE,1", "PEAR,2", "APPLE,3"])
+
+    def test_batch_task_validates_before_submitting(self):
+        path = self.tmp / "fake.xlsx"
+        path.write_text("not a workbook", encoding="utf-8")
+        with mock.patch.object(batch_api, "submit") as submit:
+            result = tasks.translate_file_batch_task.apply((str(path), str(self.tmp / "out.xlsx"), "en", "de"))
+        self.assertEqual(result.state, "FAILURE")
+        self.assertIn("doesn't match its extension", str(result.result))
+        submit.assert_not_called()
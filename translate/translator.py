@@ -20,7 +20,8 @@ MIME_MAPPINGS = {
 
 
 
-def translate_file(in_path, out_path=None, src="English", tgt="Turkish"):
+def translate_file(in_path, out_path=None, src="English", tgt="Turkish", concurrency=None, checkpoint=None,
+                   progress=None):
     """
     Main function to translate files of different formats.
     
@@ -29,6 +30,12 @@ def translate_file(in_path, out_path=None, src="English", tgt="Turkish"):
         out_path: Output file path (optional, auto-generated if None)
         src: Source language (default: "English")
         tgt: Target language (default: "Turkish")
+        concurrency: Chunk requests kept in flight for DOCX/CSV/XLSX
+            (optional, defaults to TRANSLATE_CONCURRENCY)
+        checkpoint: JobCheckpoint used to skip batches finished by an
+            earlier attempt (optional)
+        progress: Callable receiving a dict of batches/segments done and
+            total (PDF: percent and stage) as the job advances (optional)
     
     Returns:
         str: Path to the translated file
@@ -44,20 +51,19 @@ def translate_file(in_path, out_path=None, src="English", tgt="Turkish"):
     in_path_str = str(in_path)
     out_path_str = str(out_path)
     
-    mime = detect_mime(in_path).lower()
-    valid_mimes = [m.lower() for m in MIME_MAPPINGS[ext]] 
-    if mime not in valid_mimes:
-        raise ValueError(f"Invalid MIME '{mime}' for {ext}. Expected one of {valid_mimes}")
-        
+    validate_file(in_path)
+
     if ext == ".docx":
-        translate_docx(in_path_str, out_path_str, src, tgt)
+        translate_docx(in_path_str, out_path_str, src, tgt, concurrency=concurrency, checkpoint=checkpoint,
+                       progress=progress)
     elif ext == ".csv":
-        translate_csv(in_path_str, out_path_str, src, tgt)
+        translate_csv(in_path_str, out_path_str, src, tgt, concurrency=concurrency, checkpoint=checkpoint,
+                      progress=progress)
     elif ext == ".xlsx":
-        check_xlsx(in_path_str)
-        translate_xlsx(in_path_str, out_path_str, src, tgt)
+        translate_xlsx(in_path_str, out_path_str, src, tgt, concurrency=concurrency, checkpoint=checkpoint,
+                       progress=progress)
     elif ext == ".pdf":                                       
-        translate_pdf(in_path_str, out_path_str, src, tgt)   
+        translate_pdf(in_path_str, out_path_str, src, tgt, progress=progress)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
@@ -69,6 +75,20 @@ def translate_any(in_path, out_path=None, src="English", tgt="Turkish"):
     return translate_file(in_path, out_path, src, tgt)
 
 
+def validate_file(in_path):
+    """Raise ValueError unless the file's content matches its extension."""
+    in_path = Path(in_path)
+    ext = in_path.suffix.lower()
+    if ext not in MIME_MAPPINGS:
+        raise ValueError(f"Unsupported file type: {ext}")
+    mime = detect_mime(in_path).lower()
+    valid_mimes = [m.lower() for m in MIME_MAPPINGS[ext]]
+    if mime not in valid_mimes:
+        raise ValueError(f"Invalid MIME '{mime}' for {ext}. Expected one of {valid_mimes}")
+    if ext == ".xlsx" and not check_xlsx(str(in_path)):
+        raise ValueError(f"Invalid MIME '{mime}' for {ext}: the archive holds no workbook")
+
+
 def detect_mime(path: Path) -> str:
     """Detect real MIME type of a file using magic bytes."""
     with open(path, "rb") as f:
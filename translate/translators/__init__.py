@@ -3,13 +3,15 @@ from .docx_translator import translate_docx
 from .pdf_translator import translate_pdf
 from .csv_translator import translate_csv
 from .xlsx_translator import translate_xlsx
-from .utils import batched
+from .utils import batched, packed, run_batches
 
 __all__ = [
     'translate_docx',
     'translate_pdf', 
     'translate_csv',
     'translate_xlsx',
-    'batched'
+    'batched',
+    'packed',
+    'run_batches'
 ]
 
@@ -0,0 +1,162 @@
+# Economy mode: translate CSV/XLSX through the provider's Batch API
+#
+# submit() runs the format translator once with a recorder in place of the
+# checkpoint to learn its exact batches, uploads their chat requests as one
+# JSONL batch and keeps the batches next to the batch id in the job's
+# checkpoint store. collect() turns the batch output into per-batch results
+# and runs the translator with those results preloaded, so the file is
+# reassembled by the regular write-back code. Items without a usable result
+# are translated synchronously then.
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+from openai import OpenAI, OpenAIError
+from openai.types.chat import ChatCompletion
+from . import cells, csv_translator, xlsx_translator
+from .checkpoint import job_checkpoint, PreloadedCheckpoint, RecordingCheckpoint
+from .llm_client import get_client
+
+# Point BATCH_API_BASE_URL at a local stand-in to exercise the flow offline
+BATCH_API_BASE_URL = os.environ.get("BATCH_API_BASE_URL", "")
+COMPLETION_WINDOW = "24h"
+ENDPOINT = "/v1/chat/completions"
+
+FORMATS = {
+    ".csv": (csv_translator.translate_csv, csv_translator.translate_csv_chunk),
+    ".xlsx": (xlsx_translator.translate_xlsx, xlsx_translator.translate_xlsx_chunk),
+}
+
+# Terminal batch states; anything else is still in progress
+DONE_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def supports(in_path) -> bool:
+    return Path(str(in_path)).suffix.lower() in FORMATS
+
+
+def get_batch_client():
+    if BATCH_API_BASE_URL:
+        return OpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=BATCH_API_BASE_URL)
+    return get_client()
+
+
+def _record(in_path, src: str, tgt: str) -> dict:
+    """Batches the translator would send for in_path, keyed like the checkpoint."""
+    ext = Path(str(in_path)).suffix.lower()
+    translate_fn, _ = FORMATS[ext]
+    batches = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        translate_fn(in_path, os.path.join(scratch, f"dry-run{ext}"), src, tgt, concurrency=1,
+                     checkpoint=RecordingCheckpoint(batches))
+    return batches
+
+
+def _plan(batch_id) -> str:
+    return f"batch-{batch_id}"
+
+
+def submit(in_path, src: str, tgt: str):
+    """Upload every chunk request of the job as one batch.
+
+    Returns the batch id, or None when nothing needs the model. The job's
+    batches are kept in the checkpoint store for collect().
+    """
+    batches = _record(in_path, src, tgt)
+
+    lines = []
+    for key, chunk in batches.items():
+        collected = cells.prefill_chunk(chunk, src, tgt)
+        remaining = [i for i in range(len(chunk)) if i not in collected]
+        if remaining:
+            lines.append(json.dumps({
+                "custom_id": key,
+                "method": "POST",
+                "url": ENDPOINT,
+                "body": cells.chunk_request(chunk, remaining, src, tgt),
+            }, ensure_ascii=False))
+
+    batch_id = None
+    if lines:
+        client = get_batch_client()
+        payload = io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+        uploaded = client.files.create(file=("requests.jsonl", payload), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+        )
+        batch_id = batch.id
+        checkpoint = job_checkpoint(in_path, src, tgt)
+        if checkpoint is not None:
+            checkpoint.put_plan(_plan(batch_id), batches)
+    print(f"[BATCH] submitted {len(lines)}/{len(batches)} chunk requests (batch {batch_id})")
+    return batch_id
+
+
+def status(batch_id) -> str:
+    """Provider-side status of a submitted batch."""
+    if batch_id is None:
+        return "completed"
+    try:
+        return get_batch_client().batches.retrieve(batch_id).status
+    except OpenAIError as e:
+        # a flaky status call must not fail a job that is still running remotely
+        print(f"[BATCH] could not fetch status of {batch_id}: {e}")
+        return "unknown"
+
+
+def _responses(batch_id):
+    """custom_id -> ChatCompletion for every successful request of the batch."""
+    client = get_batch_client()
+    batch = client.batches.retrieve(batch_id)
+    if not batch.output_file_id:
+        return {}
+    out = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            out[record["custom_id"]] = ChatCompletion.model_validate(response["body"])
+    return out
+
+
+def collect(batch_id, in_path, out_path, src: str, tgt: str, concurrency: int = None):
+    """Reassemble the translated file from a finished (or failed) batch."""
+    translate_fn, chunk_fn = FORMATS[Path(str(in_path)).suffix.lower()]
+    if batch_id is None:
+        # nothing needed the model: every chunk is served by passthrough and memory
+        translate_fn(in_path, out_path, src, tgt, concurrency=concurrency)
+        return str(out_path)
+
+    responses = _responses(batch_id)
+    print(f"[BATCH] {len(responses)} chunk responses in batch {batch_id}")
+    checkpoint = job_checkpoint(in_path, src, tgt)
+    batches = checkpoint.get_plan(_plan(batch_id)) if checkpoint is not None else None
+    if batches is None:
+        # checkpoints off or expired; packing is deterministic, so record again
+        batches = _record(in_path, src, tgt)
+
+    results = {}
+    for key, chunk in batches.items():
+        collected = cells.prefill_chunk(chunk, src, tgt)
+        remaining = {i for i in range(len(chunk)) if i not in collected}
+        if remaining and key not in responses:
+            continue  # translated live by the final pass, with normal concurrency
+        if remaining:
+            from_model = cells.merge_response(responses[key], remaining, collected)
+            cells.remember_chunk(chunk, src, tgt, collected, from_model)
+        missing = [i for i in range(len(chunk)) if i not in collected]
+        if missing:
+            # small synchronous follow-up for whatever the batch did not return
+            for i, t in zip(missing, chunk_fn([chunk[i] for i in missing], src, tgt)):
+                collected[i] = t
+        results[key] = [collected[i] for i in range(len(chunk))]
+
+    translate_fn(in_path, out_path, src, tgt, concurrency=concurrency, checkpoint=PreloadedCheckpoint(results))
+    if checkpoint is not None:
+        checkpoint.clear()
+    return str(out_path)
@@ -0,0 +1,192 @@
+# Cell chunks for the tabular translators (CSV/XLSX)
+#
+# Both formats send their cells the same way: a JSON array of [i, text]
+# pairs answered through the return_translations tool, so index alignment
+# survives missing or reordered items. The Batch API path builds its
+# requests and merges its responses with the same helpers.
+import json
+from openai import OpenAIError
+from .memory import get_memory
+from .passthrough import passthrough_mask
+from .llm_client import chat_completion
+from .utils import MODEL, RUN_DELIM
+
+
+def _tool_schema():
+    return [{
+        "type": "function",
+        "function": {
+            "name": "return_translations",
+            "description": "Return translations aligned with input indexes",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "i": {"type": "integer"},
+                                "t": {"type": "string"}
+                            },
+                            "required": ["i", "t"]
+                        }
+                    }
+                },
+                "required": ["items"]
+            }
+        }
+    }]
+
+
+def _system_prompt(src: str, tgt: str) -> str:
+    """Instructions for every chunk of a (src, tgt) job.
+
+    Kept byte-identical across requests (the payload goes in its own message)
+    so the provider can cache the prompt prefix.
+    """
+    return (
+        f"You are a professional translator. Translate from {src} to {tgt}. "
+        "Preserve meaning, tone, punctuation, numbers, and line breaks. "
+        "Translate text exactly as given without adding commentary. "
+        f"Some texts separate differently formatted runs with {RUN_DELIM}; keep every {RUN_DELIM} "
+        "and the order of the runs.\n"
+        "The input is a JSON array of [i, text] pairs. "
+        "Return results ONLY by calling the function return_translations with an array 'items' "
+        "of objects {i, t} where 'i' is the provided index and 't' is the translation. "
+        "Return translations for ALL provided indexes, no more, no fewer, and do not reorder."
+    )
+
+
+def _build_payload(texts, indexes, note: str = "") -> str:
+    payload = json.dumps([[i, texts[i]] for i in indexes], ensure_ascii=False, separators=(",", ":"))
+    return f"Note: {note}\n{payload}" if note else payload
+
+
+def _extract_items_from_response(r):
+    choice = r.choices[0].message
+    # Prefer tool call output
+    tool_calls = getattr(choice, "tool_calls", None)
+    if tool_calls:
+        for tc in tool_calls:
+            try:
+                if getattr(tc, "type", "") == "function" and getattr(tc.function, "name", "") == "return_translations":
+                    args = tc.function.arguments
+                    data = json.loads(args) if isinstance(args, str) else args
+                    return data.get("items")
+            except Exception:
+                continue
+    # Fallback: try to parse content as JSON
+    content = (choice.content or "").strip()
+    if content:
+        try:
+            data = json.loads(content)
+            if isinstance(data, dict) and "items" in data:
+                return data["items"]
+            if isinstance(data, list):
+                # List of strings
+                return [{"i": i, "t": s} for i, s in enumerate(data)]
+        except Exception:
+            pass
+    return None
+
+
+def prefill_chunk(texts, src, tgt):
+    """Translations known without asking the model: passthrough values and
+    translation-memory hits, keyed by index."""
+    collected = {}
+
+    # Pre-fill passthrough items to avoid LLM skipping them
+    for i in passthrough_mask(texts).nonzero()[0]:
+        collected[int(i)] = str(texts[i])
+
+    # Serve segments we translated before from the translation memory
+    memory = get_memory()
+    if memory:
+        pending = [i for i in range(len(texts)) if i not in collected]
+        for j, t in memory.lookup([texts[i] for i in pending], src, tgt, MODEL).items():
+            collected[pending[j]] = t
+    return collected
+
+
+def chunk_request(texts, indexes, src, tgt, note: str = "") -> dict:
+    """Keyword arguments of the chat call asking for texts[i] for i in indexes."""
+    return dict(
+        model=MODEL,
+        temperature=0.1,
+        messages=[
+            {"role": "system", "content": _system_prompt(src, tgt)},
+            {"role": "user", "content": _build_payload(texts, indexes, note)},
+        ],
+        tools=_tool_schema(),
+        tool_choice={"type": "function", "function": {"name": "return_translations"}},
+        prompt_cache_key=f"cells:{src}:{tgt}",
+    )
+
+
+def merge_response(r, indexes, collected) -> set:
+    """Merge valid items of response r for the asked indexes into collected.
+
+    Returns the indexes that were filled.
+    """
+    filled = set()
+    for obj in _extract_items_from_response(r) or []:
+        try:
+            i = int(obj.get("i"))
+            t = obj.get("t")
+        except Exception:
+            continue
+        if i in indexes and isinstance(t, str):
+            collected[i] = t
+            filled.add(i)
+    return filled
+
+
+def remember_chunk(texts, src, tgt, collected, from_model):
+    """Store what the model produced for future jobs."""
+    memory = get_memory()
+    if memory and from_model:
+        memory.store_many([(texts[i], collected[i]) for i in sorted(from_model)], src, tgt, MODEL)
+
+
+def translate_chunk(texts, src, tgt, max_attempts: int = 3):
+    """Translate a list of cell texts using structured tool-call output.
+
+    Ensures stable index alignment and retries to fill any missing items.
+    """
+    if not texts:
+        return []
+
+    n = len(texts)
+    collected = prefill_chunk(texts, src, tgt)
+    remaining_indexes = [i for i in range(n) if i not in collected]
+    from_model = set()
+
+    attempts = 0
+    while attempts < max_attempts and remaining_indexes:
+        attempts += 1
+        # Ask for everything on the first pass, only missing indexes thereafter
+        note = "" if attempts == 1 else (
+            f"Retry {attempts-1}: Only return translations for the listed missing indexes. "
+            f"Do not include any other indexes."
+        )
+
+        try:
+            r = chat_completion(**chunk_request(texts, remaining_indexes, src, tgt, note))
+        except OpenAIError as e:
+            raise RuntimeError(f"I am really sorry an error happened/ Çok ama çok üzgünüm bir hata oluştu {e}")
+        except Exception as e:
+            raise RuntimeError(f"Your app run into a problem :( {e} ")
+
+        from_model |= merge_response(r, set(remaining_indexes), collected)
+        remaining_indexes = [i for i in range(n) if i not in collected]
+
+    remember_chunk(texts, src, tgt, collected, from_model)
+
+    # Final fallback: fill any missing with original text to maintain alignment
+    for i in range(n):
+        if i not in collected:
+            collected[i] = str(texts[i])
+
+    # Build final list in order of original indexes
+    return [collected[i] for i in range(n)]
@@ -0,0 +1,204 @@
+# Per-batch job checkpoints so retried/restarted jobs resume where they stopped
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from ..utils.analysis import content_hash
+
+# -------- configuration --------
+# TRANSLATE_CHECKPOINT_URL:
+#   file:////abs/dir   (default, ./checkpoints next to manage.py)
+#   redis://host:port/db
+#   off
+DEFAULT_URL = "file:///" + str(Path(__file__).resolve().parents[2] / "checkpoints")
+CHECKPOINT_TTL = int(os.environ.get("TRANSLATE_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+
+def batch_digest(chunk) -> str:
+    """Fingerprint of a batch's input, so a stale checkpoint is never reused."""
+    return hashlib.sha1(json.dumps(chunk, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _FileStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def get(self, job, field):
+        try:
+            return (self.root / job / f"{field}.json").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, job, field, value):
+        folder = self.root / job
+        folder.mkdir(parents=True, exist_ok=True)
+        # write-then-rename so a killed worker never leaves half a checkpoint
+        fd, tmp = tempfile.mkstemp(dir=str(folder), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp, folder / f"{field}.json")
+
+    def clear(self, job):
+        shutil.rmtree(self.root / job, ignore_errors=True)
+
+
+class _RedisStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, job, field):
+        value = self._redis.hget(f"ckpt:{job}", field)
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, job, field, value):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hset(f"ckpt:{job}", field, value)
+        pipe.expire(f"ckpt:{job}", CHECKPOINT_TTL)
+        pipe.execute()
+
+    def clear(self, job):
+        self._redis.delete(f"ckpt:{job}")
+
+
+def _store():
+    url = os.environ.get("TRANSLATE_CHECKPOINT_URL", DEFAULT_URL).strip()
+    if not url or url.lower() == "off":
+        return None
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return _RedisStore(url)
+    if url.startswith("file:///"):
+        return _FileStore(url[len("file:///"):])
+    raise ValueError(f"Unsupported TRANSLATE_CHECKPOINT_URL: {url}")
+
+
+class JobCheckpoint:
+    """Completed batch results of one job, keyed by document hash, target language and batch index."""
+
+    def __init__(self, store, job: str, scope: str = ""):
+        self.store = store
+        self.job = job
+        self.scope = scope
+        self.resumed = 0
+
+    def scoped(self, name) -> "JobCheckpoint":
+        """Checkpoint for a sub-sequence of batches (e.g. one CSV row chunk)."""
+        return JobCheckpoint(self.store, self.job, f"{self.scope}{name}.")
+
+    def get(self, index: int, chunk):
+        raw = self.store.get(self.job, f"{self.scope}{index}")
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        if data.get("digest") != batch_digest(chunk):
+            return None
+        self.resumed += 1
+        return data["result"]
+
+    def put(self, index: int, chunk, result):
+        value = json.dumps({"digest": batch_digest(chunk), "result": result}, ensure_ascii=False)
+        self.store.put(self.job, f"{self.scope}{index}", value)
+
+    def put_plan(self, name: str, plan: dict):
+        """Keep a job-level record (e.g. a submitted batch's batches) next to its results."""
+        self.store.put(self.job, f"plan.{name}", json.dumps(plan, ensure_ascii=False))
+
+    def get_plan(self, name: str):
+        raw = self.store.get(self.job, f"plan.{name}")
+        return json.loads(raw) if raw is not None else None
+
+    def clear(self):
+        self.store.clear(self.job)
+
+
+class RecordingCheckpoint:
+    """Checkpoint stand-in that records each batch and answers with its source texts."""
+
+    def __init__(self, batches, scope=""):
+        self.batches = batches
+        self.scope = scope
+        self.resumed = 0
+
+    def scoped(self, name):
+        return RecordingCheckpoint(self.batches, f"{self.scope}{name}.")
+
+    def get(self, index, chunk):
+        self.batches[f"{self.scope}{index}"] = list(chunk)
+        return [str(t) for t in chunk]
+
+    def put(self, index, chunk, result):
+        pass
+
+
+class PreloadedCheckpoint:
+    """Checkpoint stand-in serving results gathered elsewhere (batch output, shard tasks)."""
+
+    def __init__(self, results, scope=""):
+        self.results = results
+        self.scope = scope
+        self.resumed = 0
+
+    def scoped(self, name):
+        return PreloadedCheckpoint(self.results, f"{self.scope}{name}.")
+
+    def get(self, index, chunk):
+        result = self.results.get(f"{self.scope}{index}")
+        if result is not None and len(result) == len(chunk):
+            self.resumed += 1
+            return result
+        return None
+
+    def put(self, index, chunk, result):
+        pass
+
+
+class TranslationsCheckpoint:
+    """Checkpoint stand-in answering every batch whose segments all have a
+    known translation (shard results), whatever its key."""
+
+    def __init__(self, translations: dict):
+        self.translations = translations
+        self.resumed = 0
+
+    def scoped(self, name):
+        return self
+
+    def get(self, index, chunk):
+        if not all(t in self.translations for t in chunk):
+            return None
+        self.resumed += 1
+        return [self.translations[t] for t in chunk]
+
+    def put(self, index, chunk, result):
+        pass
+
+
+def count_start(task_id: str) -> int:
+    """Record that task_id started; returns how many of its starts have not
+    finished (1 on a first run, more when earlier workers died mid-task)."""
+    store = _store()
+    if store is None or not task_id:
+        return 1
+    job = f"starts-{task_id}"
+    count = int(store.get(job, "count") or 0) + 1
+    store.put(job, "count", str(count))
+    return count
+
+
+def clear_starts(task_id: str):
+    """Forget task_id's unfinished starts once a run of it has finished."""
+    store = _store()
+    if store is not None and task_id:
+        store.clear(f"starts-{task_id}")
+
+
+def job_checkpoint(in_path, src: str, tgt: str):
+    """Checkpoint for translating in_path from src to tgt, or None when disabled."""
+    store = _store()
+    if store is None:
+        return None
+    key = hashlib.sha256(f"{content_hash(in_path)}|{src}|{tgt}".encode("utf-8")).hexdigest()
+    return JobCheckpoint(store, key)
@@ -1,204 +1,177 @@
 # CSV Translation Module
-import json
-import re
-import time
+import csv
+import os
+from collections import OrderedDict
 import pandas as pd
-from openai import OpenAIError
-from .utils import batched, client, MODEL
-
-
-def _tool_schema():
-    return [{
-        "type": "function",
-        "function": {
-            "name": "return_translations",
-            "description": "Return translations aligned with input indexes",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "items": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "i": {"type": "integer"},
-                                "t": {"type": "string"}
-                            },
-                            "required": ["i", "t"]
-                        }
-                    }
-                },
-                "required": ["items"]
-            }
-        }
-    }]
-
-
-def _build_prompt(items, src: str, tgt: str, note: str = "") -> str:
-    intro = (
-        f"You are a professional translator. Translate from {src} to {tgt}. "
-        f"Preserve meaning, tone, punctuation, numbers, and line breaks. "
-        f"Translate text exactly as given without adding commentary."
-    )
-    constraints = (
-        "Return results ONLY by calling the function return_translations with an array 'items' "
-        "of objects {{i, t}} where 'i' is the provided index and 't' is the translation. "
-        "Return translations for ALL provided indexes, no more, no fewer, and do not reorder."
-    )
-    payload = json.dumps({"items": items}, ensure_ascii=False)
-    extra = f"\n\nNote: {note}" if note else ""
-    return f"{intro}\n{constraints}{extra}\n\nInput JSON:\n{payload}"
-
-
-def _extract_items_from_response(r):
-    choice = r.choices[0].message
-    # Prefer tool call output
-    tool_calls = getattr(choice, "tool_calls", None)
-    if tool_calls:
-        for tc in tool_calls:
-            try:
-                if getattr(tc, "type", "") == "function" and getattr(tc.function, "name", "") == "return_translations":
-                    args = tc.function.arguments
-                    data = json.loads(args) if isinstance(args, str) else args
-                    return data.get("items")
-            except Exception:
-                continue
-    # Fallback: try to parse content as JSON
-    content = (choice.content or "").strip()
-    if content:
-        try:
-            data = json.loads(content)
-            if isinstance(data, dict) and "items" in data:
-                return data["items"]
-            if isinstance(data, list):
-                # List of strings
-                return [{"i": i, "t": s} for i, s in enumerate(data)]
-        except Exception:
-            pass
-    return None
-
-
-_SYMBOLS_RE = re.compile(r"^[\W_]+$", re.UNICODE)
-
-
-def _is_passthrough(text: str) -> bool:
-    """Return True if text should bypass translation (numbers/blank/symbol-only)."""
-    if text is None:
-        return True
-    s = str(text)
-    if not s.strip():
-        return True
-    # number-like (int/float) or symbol-only
+from .cells import translate_chunk
+from .memory import log_stats
+from .passthrough import passthrough_mask, skipped_columns
+from .llm_client import log_usage, usage_snapshot
+from .utils import log_dedup, packed, run_batches, tracked
+
+
+# Cells are sent the same way for every tabular format (cells.py)
+translate_csv_chunk = translate_chunk
+
+
+# Files above this size are translated with the streaming engine
+CSV_STREAM_THRESHOLD = int(os.environ.get("CSV_STREAM_THRESHOLD", str(10 * 1024 * 1024)))
+CSV_STREAM_CHUNK_ROWS = int(os.environ.get("CSV_STREAM_CHUNK_ROWS", "5000"))
+# Translations remembered across chunks, so repeated values are sent once
+CSV_STREAM_CACHE_SIZE = 50000
+
+
+# Delimiters the sniffer may choose; anything else (e.g. a letter picked from
+# single-column text) falls back to the comma dialect
+CSV_DELIMITERS = ",;\t|"
+
+
+def _sniff_dialect(in_path: str):
+    with open(in_path, newline="", encoding="utf-8") as f:
+        sample = f.read(64 * 1024)
     try:
-        float(s.replace(",", "").replace(" ", ""))
-        return True
-    except Exception:
-        pass
-    return bool(_SYMBOLS_RE.match(s))
+        dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+    except csv.Error:
+        return csv.excel
+    return dialect if dialect.delimiter in CSV_DELIMITERS else csv.excel
 
 
-def translate_csv_chunk(texts, src, tgt, max_attempts: int = 3):
-    """Translate a list of CSV cell texts using structured tool-call output.
+def translate_csv_stream(in_path: str, out_path: str, src: str, tgt: str, batch_size: int = None,
+                         concurrency: int = None, chunk_rows: int = None, checkpoint=None, progress=None):
+    """Translate a CSV file chunk by chunk with memory bounded by `chunk_rows`.
 
-    Ensures stable index alignment and retries to fill any missing items.
+    Rows are written in input order as each chunk completes, using the input's
+    sniffed dialect (delimiter and quoting).
+    """
+    usage = usage_snapshot()
+    chunk_rows = chunk_rows or CSV_STREAM_CHUNK_ROWS
+    dialect = _sniff_dialect(str(in_path))
+    seen = OrderedDict()  # bounded LRU of source -> translation
+    total, sent, chunk_no = 0, 0, 0
+    skipped = None
+
+    # Totals only grow chunk by chunk, so the reported percent follows the
+    # input position: characters already written plus the translated share
+    # of the chunk in flight
+    size = max(1, os.path.getsize(str(in_path)))
+    position = {"read": 0, "flushed": 0, "chunk_base": 0}
+
+    def report(state):
+        in_chunk = state["segments_total"] - position["chunk_base"]
+        share = (state["segments_done"] - position["chunk_base"]) / in_chunk if in_chunk else 1.0
+        done = position["flushed"] + (position["read"] - position["flushed"]) * share
+        progress(dict(state, percent=round(min(100.0, 100 * done / size), 1)))
+
+    tracker = tracked(report if progress is not None else None)
+
+    def lines(f):
+        for line in f:
+            position["read"] += len(line)
+            yield line
+
+    def flush(rows, writer):
+        nonlocal total, sent, chunk_no, skipped
+        first = skipped is None
+        if first:
+            # the first chunk decides which columns are skipped for the whole file
+            skipped = skipped_columns(pd.DataFrame(rows[1:]), "CSV")
+        cells = [(r, c) for r, row in enumerate(rows) for c, v in enumerate(row)
+                 if v.strip() and (c not in skipped or (first and r == 0))]
+        cells = [cell for cell, keep in zip(cells, ~passthrough_mask(rows[r][c] for r, c in cells)) if keep]
+        total += len(cells)
+        pending = list(dict.fromkeys(rows[r][c] for r, c in cells if rows[r][c] not in seen))
+        sent += len(pending)
+        scope = checkpoint.scoped(chunk_no) if checkpoint is not None else None
+        chunk_no += 1
+        if tracker is not None:
+            position["chunk_base"] = tracker.segments_total
+        translated = []
+        for chunk_out in run_batches(translate_csv_chunk, packed(pending, batch_size), src, tgt, concurrency, scope,
+                                     tracker):
+            translated.extend(chunk_out)
+        seen.update(zip(pending, translated))
+        for r, c in cells:
+            value = seen[rows[r][c]]
+            seen.move_to_end(rows[r][c])
+            rows[r][c] = value
+        while len(seen) > CSV_STREAM_CACHE_SIZE:
+            seen.popitem(last=False)
+        writer.writerows(rows)
+        position["flushed"] = position["read"]
+
+    with open(str(in_path), newline="", encoding="utf-8") as fin, \
+            open(str(out_path), "w", newline="", encoding="utf-8") as fout:
+        reader = csv.reader(lines(fin), dialect)
+        writer = csv.writer(fout, dialect)
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                flush(rows, writer)
+                rows = []
+        if rows:
+            flush(rows, writer)
+    if tracker is not None:
+        progress(dict(tracker.snapshot(), percent=100.0))
+
+    log_dedup("CSV", total, sent)
+    print(f"Translated CSV (streaming) → {out_path}")
+    log_stats("CSV")
+    log_usage("CSV", usage)
+
+
+def translate_csv(in_path: str, out_path: str, src: str, tgt: str, batch_size: int = None,
+                  concurrency: int = None, streaming: bool = None, checkpoint=None, progress=None):
+    """Translate a CSV file, keeping up to `concurrency` chunk requests in flight.
+
+    Files larger than CSV_STREAM_THRESHOLD (or streaming=True) go through
+    translate_csv_stream to keep memory flat.
     """
-    if not texts:
-        return []
-
-    n = len(texts)
-    remaining_indexes = list(range(n))
-    collected = {}
-
-    # Pre-fill passthrough items to avoid LLM skipping them
-    for i, val in enumerate(texts):
-        if _is_passthrough(val):
-            collected[i] = str(val)
-
-    # Prepare input items with indexes and source text
-    full_items = [{"i": i, "s": texts[i]} for i in range(n) if i not in collected]
-
-    attempts = 0
-    while attempts < max_attempts and remaining_indexes:
-        attempts += 1
-        # Build the subset to ask for (all on first pass, missing thereafter)
-        ask_items = (
-            full_items if attempts == 1 else [{"i": i, "s": texts[i]} for i in remaining_indexes]
-        )
-        note = "" if attempts == 1 else (
-            f"Retry {attempts-1}: Only return translations for the listed missing indexes. "
-            f"Do not include any other indexes."
-        )
-
-        try:
-            r = client.chat.completions.create(
-                model=MODEL,
-                temperature=0.1,
-                messages=[{
-                    "role": "user",
-                    "content": _build_prompt(ask_items, src, tgt, note)
-                }],
-                tools=_tool_schema(),
-                tool_choice={"type": "function", "function": {"name": "return_translations"}},
-            )
-        except OpenAIError as e:
-            raise RuntimeError(f"I am really sorry an error happened/ Çok ama çok üzgünüm bir hata oluştu {e}")
-        except Exception as e:
-            raise RuntimeError(f"Your app run into a problem :( {e} ")
-
-        items = _extract_items_from_response(r)
-        if not items:
-            # Give the model another shot next loop
-            time.sleep(0.2)
-            continue
-
-        # Merge valid items by index
-        for obj in items:
-            try:
-                i = int(obj.get("i"))
-                t = obj.get("t")
-            except Exception:
-                continue
-            if i in range(n) and isinstance(t, str):
-                collected[i] = t
-
-        # Update remaining indexes
-        remaining_indexes = [i for i in range(n) if i not in collected]
-        if remaining_indexes:
-            time.sleep(0.2)  # light backoff before retrying missing ones
-
-    # Final fallback: fill any missing with original text to maintain alignment
-    if len(collected) != n:
-        missing = [i for i in range(n) if i not in collected]
-        for i in missing:
-            collected[i] = str(texts[i])
-
-    # Build final list in order of original indexes
-    return [collected[i] for i in range(n)]
-
-def translate_csv(in_path: str, out_path: str, src: str, tgt: str, batch_size: int = 80):
-    """Translate a CSV file"""
-    df = pd.read_csv(str(in_path), header=None, dtype=str).fillna('')
+    if streaming is None:
+        streaming = os.path.getsize(str(in_path)) > CSV_STREAM_THRESHOLD
+    if streaming:
+        return translate_csv_stream(in_path, out_path, src, tgt, batch_size, concurrency, checkpoint=checkpoint,
+                                    progress=progress)
+
+    usage = usage_snapshot()
+    # same delimiter and quoting as the streaming path, in and out
+    dialect = _sniff_dialect(str(in_path))
+    fmt = dict(sep=dialect.delimiter, quotechar=dialect.quotechar)
+    df = pd.read_csv(str(in_path), header=None, dtype=str, **fmt).fillna('')
     if df.empty:
-        df.to_csv(str(out_path), index=False, header=False)
+        df.to_csv(str(out_path), index=False, header=False, **fmt)
         print(f"Empty CSV. Saved copy → {out_path}")
         return
 
+    # Row 0 is usually the header, so it is kept out of the column profile
+    # and stays translatable in skipped columns
+    skipped = skipped_columns(df.iloc[1:], "CSV")
     original_series = df.stack()
-    is_translatable = original_series.astype(str).str.strip().astype(bool)
+    is_translatable = ~passthrough_mask(original_series)
+    if skipped:
+        rows, cols = original_series.index.get_level_values(0), original_series.index.get_level_values(1)
+        is_translatable &= ~(cols.isin(skipped) & (rows != df.index[0]))
     to_translate = original_series[is_translatable]
 
     if to_translate.empty:
-        df.to_csv(str(out_path), index=False, header=False)
+        df.to_csv(str(out_path), index=False, header=False, **fmt)
         print(f"No text to translate in CSV. Saved copy → {out_path}")
         return
 
-    texts = to_translate.tolist()
+    # Translate each distinct value once and fan the result back out
+    codes, uniques = pd.factorize(to_translate, sort=False)
+    texts = uniques.tolist()
+    log_dedup("CSV", len(to_translate), len(texts))
     translated = []
-    for chunk in batched(texts, batch_size):
-        translated.extend(translate_csv_chunk(chunk, src, tgt))
+    for chunk_out in run_batches(translate_csv_chunk, packed(texts, batch_size), src, tgt, concurrency, checkpoint,
+                                 tracked(progress)):
+        translated.extend(chunk_out)
 
-    translated_series = pd.Series(translated, index=to_translate.index)
+    translated_unique = pd.Series(translated, dtype=object)
+    translated_series = pd.Series(translated_unique.take(codes).to_numpy(), index=to_translate.index)
     df.update(translated_series.unstack())
-    df.to_csv(str(out_path), index=False, header=False)
+    df.to_csv(str(out_path), index=False, header=False, **fmt)
     print(f"Translated CSV → {out_path}")
+    log_stats("CSV")
+    log_usage("CSV", usage)
 
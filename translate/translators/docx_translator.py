@@ -1,5 +1,11 @@
+import os
 from docx import Document
-from .utils import batched, client, MODEL, PARA_DELIM, RUN_DELIM
+from .memory import get_memory, log_stats
+from .llm_client import chat_completion, log_usage, usage_snapshot
+from .utils import dedupe, log_dedup, MODEL, packed, PARA_DELIM, run_batches, RUN_DELIM, tracked
+
+# Paragraphs per request, at most (token budgets may cut a request shorter)
+BATCH_SIZE = 100
 
 def get_run_texts(paragraph):
     """Return the list of run texts for a single paragraph."""
@@ -18,6 +24,19 @@ def set_run_texts(paragraph, new_texts):
     if len(new_texts) > k and k > 0:
         runs[k - 1].text += "".join(new_texts[k:])
 
+class ParagraphMismatch(RuntimeError):
+    """The model returned a different number of paragraphs than it was sent."""
+
+    def __init__(self, sent, parts):
+        super().__init__(f"[DOCX] Paragraph mismatch: sent {sent} got {len(parts)}")
+        self.parts = parts
+
+
+class JoinedParagraph(str):
+    """A single paragraph whose parts were joined after a mismatch; a fallback,
+    so it is not stored in the translation memory."""
+
+
 def translate_docx_chunk(paragraph_payloads, src, tgt):
     """
     paragraph_payloads: list[str], each is one paragraph's runs joined by RUN_DELIM
@@ -26,30 +45,80 @@ def translate_docx_chunk(paragraph_payloads, src, tgt):
     if not paragraph_payloads:
         return []
 
-    prompt = (
+    # Only paragraphs the translation memory has not seen go to the model
+    memory = get_memory()
+    if not memory:
+        return _request_bisecting(paragraph_payloads, src, tgt)
+
+    out = memory.lookup(paragraph_payloads, src, tgt, MODEL)
+    misses = [i for i in range(len(paragraph_payloads)) if i not in out]
+    if misses:
+        sent = [paragraph_payloads[i] for i in misses]
+        fresh = _request_bisecting(sent, src, tgt)
+        memory.store_many([(p, t) for p, t in zip(sent, fresh) if not isinstance(t, JoinedParagraph)],
+                          src, tgt, MODEL)
+        out.update(zip(misses, fresh))
+    return [out[i] for i in range(len(paragraph_payloads))]
+
+def _request_bisecting(paragraph_payloads, src, tgt):
+    """Request a batch; on a paragraph mismatch re-request it in halves.
+
+    Only the failing batch is retried, recursively down to single paragraphs.
+    A single paragraph that still comes back split has its parts joined.
+    """
+    try:
+        return _request_docx_chunk(paragraph_payloads, src, tgt)
+    except ParagraphMismatch as e:
+        if len(paragraph_payloads) == 1:
+            print(f"{e}; joining the parts of a single paragraph")
+            return [JoinedParagraph(" ".join(part.strip() for part in e.parts))]
+        print(f"{e}; retrying in halves")
+        mid = len(paragraph_payloads) // 2
+        return (_request_bisecting(paragraph_payloads[:mid], src, tgt)
+                + _request_bisecting(paragraph_payloads[mid:], src, tgt))
+
+def _system_prompt(src, tgt) -> str:
+    """Instructions for every DOCX chunk of a (src, tgt) job; byte-stable so the prefix caches."""
+    return (
         f"You are a professional translator. Translate from {src} to {tgt}. "
         f"Crucially, keep ALL delimiters EXACTLY: paragraph delimiter {PARA_DELIM} "
         f"and run delimiter {RUN_DELIM}. Do NOT add or remove delimiters; "
         f"preserve their count. Keep numbers and punctuation intact."
     )
-    joined = PARA_DELIM.join(paragraph_payloads)
 
-    r = client.chat.completions.create(
+def chunk_request(paragraph_payloads, src, tgt) -> dict:
+    """Keyword arguments of the chat call translating paragraph_payloads."""
+    return dict(
         model=MODEL,
         temperature=0.1,
-        messages=[{
-            "role": "user",
-            "content": f"{prompt}\n\n{joined}"
-        }],
+        messages=[
+            {"role": "system", "content": _system_prompt(src, tgt)},
+            {"role": "user", "content": PARA_DELIM.join(paragraph_payloads)},
+        ],
+        prompt_cache_key=f"docx:{src}:{tgt}",
     )
+
+def _request_docx_chunk(paragraph_payloads, src, tgt):
+    """Send paragraph payloads to the model in one delimited request."""
+    r = chat_completion(**chunk_request(paragraph_payloads, src, tgt))
     out = (r.choices[0].message.content or "").strip()
     parts = out.split(PARA_DELIM)
     if len(parts) != len(paragraph_payloads):
-        raise RuntimeError(f"[DOCX] Paragraph mismatch: sent {len(paragraph_payloads)} got {len(parts)}")
+        raise ParagraphMismatch(len(paragraph_payloads), parts)
     return parts
 
-def translate_docx(in_path: str, out_path: str, src: str, tgt: str, batch_size: int = 40):
+# DOCX_ENGINE: "xml" (single lxml pass incl. headers/footers/notes) or "python-docx"
+DOCX_ENGINE = os.environ.get("DOCX_ENGINE", "xml").lower()
+
+
+def translate_docx(in_path: str, out_path: str, src: str, tgt: str, batch_size: int = BATCH_SIZE,
+                   concurrency: int = None, engine: str = None, checkpoint=None, progress=None):
     """Translate a DOCX file preserving formatting"""
+    if (engine or DOCX_ENGINE).lower() == "xml":
+        from .docx_xml_translator import translate_docx_xml
+        return translate_docx_xml(in_path, out_path, src, tgt, batch_size, concurrency, checkpoint, progress)
+
+    usage = usage_snapshot()
     doc = Document(str(in_path))
 
     # Collect all paragraphs, including those inside table cells, uniformly
@@ -77,15 +146,20 @@ def translate_docx(in_path: str, out_path: str, src: str, tgt: str, batch_size:
         norm = [t if t != "" else " " for t in runs]
         items.append(RUN_DELIM.join(norm))
 
-    # Translate in batches (keep order)
+    # Translate each distinct paragraph once, in batches (keep order)
+    uniques, inverse = dedupe(items)
+    log_dedup("DOCX", len(items), len(uniques))
     out_items = []
-    for chunk in batched(items, batch_size):
-        out_items.extend(translate_docx_chunk(chunk, src, tgt))
+    for chunk_out in run_batches(translate_docx_chunk, packed(uniques, batch_size), src, tgt, concurrency,
+                                 checkpoint, tracked(progress)):
+        out_items.extend(chunk_out)
 
     # Write back run-by-run
-    for p, para_txt in zip(paragraphs, out_items):
-        run_texts = para_txt.split(RUN_DELIM)
+    for p, j in zip(paragraphs, inverse):
+        run_texts = out_items[j].split(RUN_DELIM)
         set_run_texts(p, run_texts)
 
     doc.save(str(out_path))
     print(f"Translated DOCX → {out_path}")
+    log_stats("DOCX")
+    log_usage("DOCX", usage)
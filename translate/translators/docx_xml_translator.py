@@ -0,0 +1,128 @@
+# DOCX Translation Module (XML engine)
+# One lxml pass per part over the body, tables, text boxes, headers, footers,
+# footnotes and endnotes. Each w:p is collected exactly once, so merged table
+# cells are not sent repeatedly, and untouched parts are copied byte-for-byte.
+import re
+import zipfile
+from pathlib import Path
+from lxml import etree
+from .docx_translator import BATCH_SIZE, translate_docx_chunk
+from .llm_client import log_usage, usage_snapshot
+from .memory import log_stats
+from .ooxml import rewrite_zip, set_preserved_text, spooled
+from .utils import dedupe, log_dedup, packed, run_batches, RUN_DELIM, tracked
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_R, W_T = f"{W}p", f"{W}r", f"{W}t"
+
+# Parts holding translatable paragraphs
+PART_RE = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+
+
+def _run_text_nodes(paragraph):
+    """w:t nodes of each run that belongs directly to `paragraph`.
+
+    Runs inside a nested paragraph (e.g. a text box anchored in this one)
+    belong to that paragraph instead.
+    """
+    runs = []
+    for r in paragraph.iter(W_R):
+        owner = r.getparent()
+        while owner is not None and owner.tag != W_P:
+            owner = owner.getparent()
+        if owner is not paragraph:
+            continue
+        nodes = r.findall(W_T)
+        if nodes:
+            runs.append(nodes)
+    return runs
+
+
+def _run_text(nodes) -> str:
+    return "".join(t.text or "" for t in nodes)
+
+
+def _set_run_text(nodes, text):
+    set_preserved_text(nodes[0], text)
+    for t in nodes[1:]:
+        t.text = ""
+
+
+def _set_run_texts(runs, new_texts):
+    """Write translated texts back into runs; mirrors docx_translator.set_run_texts."""
+    k = min(len(runs), len(new_texts))
+    for i in range(k):
+        _set_run_text(runs[i], new_texts[i])
+    for i in range(k, len(runs)):
+        _set_run_text(runs[i], "")
+    if len(new_texts) > k and k > 0:
+        _set_run_text(runs[k - 1], _run_text(runs[k - 1]) + "".join(new_texts[k:]))
+
+
+def read_parts(zin) -> dict:
+    """Parsed XML tree of every part holding translatable paragraphs."""
+    return {
+        name: etree.fromstring(zin.read(name), etree.XMLParser(huge_tree=True))
+        for name in zin.namelist() if PART_RE.match(name)
+    }
+
+
+def iter_paragraphs(tree):
+    """(runs, payload) for each translatable paragraph; payload joins run texts with RUN_DELIM."""
+    for p in tree.iter(W_P):
+        runs = _run_text_nodes(p)
+        texts = [_run_text(nodes) for nodes in runs]
+        if not "".join(texts).strip():
+            continue
+        # normalize empty runs so run count stays stable
+        yield runs, RUN_DELIM.join(t if t != "" else " " for t in texts)
+
+
+def docx_payloads(in_path) -> list:
+    """Payloads translate_docx_xml would send for in_path, in document order."""
+    with zipfile.ZipFile(str(in_path)) as zin:
+        trees = read_parts(zin)
+    return [payload for tree in trees.values() for _, payload in iter_paragraphs(tree)]
+
+
+def translate_docx_xml(in_path: Path, out_path: Path, src: str, tgt: str, batch_size: int = BATCH_SIZE,
+                       concurrency: int = None, checkpoint=None, progress=None):
+    """Translate a DOCX file at the XML level preserving formatting"""
+    usage = usage_snapshot()
+    with zipfile.ZipFile(str(in_path)) as zin:
+        trees = read_parts(zin)
+    paragraphs, items = [], []
+    for tree in trees.values():
+        for runs, payload in iter_paragraphs(tree):
+            paragraphs.append(runs)
+            items.append(payload)
+
+    if not paragraphs:
+        rewrite_zip(in_path, out_path, {})
+        print(f"No translatable paragraphs. Saved unchanged → {out_path}")
+        return
+
+    # Translate each distinct paragraph once, in batches (keep order)
+    uniques, inverse = dedupe(items)
+    log_dedup("DOCX", len(items), len(uniques))
+    out_items = []
+    for chunk_out in run_batches(translate_docx_chunk, packed(uniques, batch_size), src, tgt, concurrency,
+                                 checkpoint, tracked(progress)):
+        out_items.extend(chunk_out)
+
+    for runs, j in zip(paragraphs, inverse):
+        _set_run_texts(runs, out_items[j].split(RUN_DELIM))
+
+    replacements = {}
+    try:
+        for name, tree in trees.items():
+            part = replacements[name] = spooled()
+            part.write(etree.tostring(tree, xml_declaration=True, encoding="UTF-8", standalone=True))
+        rewrite_zip(in_path, out_path, replacements)
+    finally:
+        for part in replacements.values():
+            part.close()
+
+    print(f"Translated DOCX ({len(items)} paragraphs, {len(trees)} parts) → {out_path}")
+    log_stats("DOCX")
+    log_usage("DOCX", usage)
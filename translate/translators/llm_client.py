@@ -0,0 +1,193 @@
+# Pooled, lazily-initialized LLM client with Retry-After-aware backoff
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    OpenAI,
+)
+from .rate_limit import get_governor
+from .utils import count_tokens, OUTPUT_RATIO
+
+# -------- configuration --------
+# Set OPENAI_API_KEY in your environment.
+load_dotenv()
+
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+CALL_TIMEOUT = float(os.environ.get("LLM_CALL_TIMEOUT", "120"))
+MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "60"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_client = None
+_client_lock = threading.Lock()
+
+# Running token counters of this process; jobs report their share with
+# usage_snapshot() at the start and log_usage() at the end
+_usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+_usage_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    """Return the process-wide OpenAI client, building it on first use.
+
+    Built lazily so importing the translators (e.g. in the Celery parent
+    process or Django views) does not need OPENAI_API_KEY or open sockets.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(CALL_TIMEOUT, connect=CONNECT_TIMEOUT),
+                )
+                _client = OpenAI(
+                    api_key=os.environ["OPENAI_API_KEY"],
+                    base_url=os.environ.get("OPENAI_BASE_URL") or None,
+                    http_client=http_client,
+                    max_retries=0,  # retries are handled in chat_completion
+                )
+    return _client
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient errors (timeouts, dropped connections, 429/5xx) are worth retrying."""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after(error: Exception):
+    """Seconds the provider asked us to wait, from Retry-After(-Ms) headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    wait = retry_after(error) if error is not None else None
+    if wait is not None:
+        delay = max(delay, min(wait, BACKOFF_MAX))
+    return delay
+
+
+def estimate_tokens(kwargs) -> int:
+    """Rough prompt + completion cost of a chat request, for the rate governor."""
+    text = "".join(str(m.get("content") or "") for m in kwargs.get("messages", []))
+    prompt = count_tokens(text) + 10 * len(kwargs.get("messages", []))
+    if kwargs.get("tools"):
+        prompt += 100
+    return prompt + int(prompt * OUTPUT_RATIO)
+
+
+def _record_usage(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    with _usage_lock:
+        _usage["requests"] += 1
+        _usage["prompt_tokens"] += usage.prompt_tokens or 0
+        _usage["cached_tokens"] += cached
+        _usage["completion_tokens"] += usage.completion_tokens or 0
+
+
+def usage_snapshot() -> dict:
+    """The process counters now; pass it to log_usage() when the job ends."""
+    with _usage_lock:
+        return dict(_usage)
+
+
+def usage_stats(since: dict = None) -> dict:
+    """Prompt tokens served from the provider's prompt cache vs. processed anew,
+    counted from the usage_snapshot() `since` (process totals without one)."""
+    stats = usage_snapshot()
+    if since:
+        stats = {k: v - since.get(k, 0) for k, v in stats.items()}
+    stats["uncached_tokens"] = stats["prompt_tokens"] - stats["cached_tokens"]
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+def log_usage(label: str, since: dict = None):
+    """Print the token counters of a job that took usage_snapshot() `since` when it started."""
+    print(f"[LLM] {label}: {usage_stats(since)}")
+
+
+def _governed(action, *args):
+    """Run a governor call; Redis trouble degrades to ungoverned, never fails the job."""
+    try:
+        return action(*args)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        print(f"[LLM] rate governor unavailable, continuing without it: {e}")
+
+
+def chat_completion(**kwargs):
+    """client.chat.completions.create with retries on transient errors.
+
+    Fatal errors (auth, bad request, ...) are raised immediately; retryable
+    ones are retried up to LLM_MAX_ATTEMPTS times. Every attempt first
+    acquires capacity from the cluster-wide rate governor when one is set.
+    """
+    kwargs.setdefault("timeout", CALL_TIMEOUT)
+    governor = get_governor()
+    estimated = estimate_tokens(kwargs) if governor else 0
+    attempt = 0
+    while True:
+        if governor:
+            _governed(governor.acquire, estimated)
+        try:
+            r = get_client().chat.completions.create(**kwargs)
+        except Exception as e:
+            attempt += 1
+            if not is_retryable(e) or attempt >= MAX_ATTEMPTS:
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"[LLM] {type(e).__name__} (attempt {attempt}/{MAX_ATTEMPTS}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        usage = getattr(r, "usage", None)
+        if usage is not None:
+            _record_usage(usage)
+            if governor:
+                _governed(governor.settle, estimated, usage.total_tokens)
+        return r
@@ -0,0 +1,215 @@
+# Segment-level translation memory shared by all format translators
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+try:
+    import pyzstd
+except ImportError:  # compression is optional
+    pyzstd = None
+
+# -------- configuration --------
+# TRANSLATION_MEMORY_URL:
+#   sqlite:////abs/path.sqlite3 (default, next to manage.py)
+#   redis://host:port/db
+#   off                         (disable the memory)
+DEFAULT_URL = "sqlite:///" + str(Path(__file__).resolve().parents[2] / "translation_memory.sqlite3")
+MAX_ENTRIES = int(os.environ.get("TRANSLATION_MEMORY_MAX_ENTRIES", "1000000"))
+COMPRESS = os.environ.get("TRANSLATION_MEMORY_ZSTD", "0") == "1"
+REDIS_TTL = int(os.environ.get("TRANSLATION_MEMORY_TTL", str(90 * 24 * 3600)))
+
+_RAW, _ZSTD = b"r", b"z"
+
+
+def normalize_segment(text: str) -> str:
+    """Canonical form used for keys: NFC and trimmed; inner whitespace and line
+    breaks are part of the segment and are kept."""
+    return unicodedata.normalize("NFC", str(text)).strip()
+
+
+def segment_key(src: str, tgt: str, model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_segment(text).encode("utf-8")).hexdigest()
+    return f"{src}|{tgt}|{model}|{digest}"
+
+
+def _encode(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if COMPRESS and pyzstd is not None:
+        return _ZSTD + pyzstd.compress(data)
+    return _RAW + data
+
+
+def _decode(blob: bytes) -> str:
+    blob = bytes(blob)
+    if blob[:1] == _ZSTD:
+        if pyzstd is None:
+            raise RuntimeError("Translation memory entry is zstd-compressed but pyzstd is not installed")
+        return pyzstd.decompress(blob[1:]).decode("utf-8")
+    return blob[1:].decode("utf-8")
+
+
+def _rewrap(source: str, translated: str) -> str:
+    """Put the source's leading/trailing whitespace around a stored translation."""
+    s = str(source)
+    lead = s[: len(s) - len(s.lstrip())]
+    trail = s[len(s.rstrip()):]
+    return f"{lead}{translated}{trail}"
+
+
+class _SQLiteStore:
+    def __init__(self, path: str, max_entries: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tm (k TEXT PRIMARY KEY, v BLOB NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tm_used_at ON tm(used_at)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite caps bound parameters, query in slices
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                for k, v in self._conn.execute(f"SELECT k, v FROM tm WHERE k IN ({marks})", part):
+                    found[k] = v
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE tm SET used_at=? WHERE k=?", [(now, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, pairs):
+        if not pairs:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tm (k, v, used_at) VALUES (?, ?, ?)",
+                [(k, v, now) for k, v in pairs],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM tm").fetchone()
+            if count > self.max_entries:
+                # evict least recently used entries
+                self._conn.execute(
+                    "DELETE FROM tm WHERE k IN (SELECT k FROM tm ORDER BY used_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+
+class _RedisStore:
+    """Redis-backed store. Size/LRU eviction is left to the server's maxmemory-policy."""
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        names = [f"tm:{k}" for k in keys]
+        values = self._redis.mget(names)
+        found = {k: v for k, v in zip(keys, values) if v is not None}
+        if found:
+            pipe = self._redis.pipeline(transaction=False)
+            for k in found:
+                pipe.expire(f"tm:{k}", self.ttl)
+            pipe.execute()
+        return found
+
+    def put_many(self, pairs):
+        if not pairs:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for k, v in pairs:
+            pipe.set(f"tm:{k}", v, ex=self.ttl)
+        pipe.execute()
+
+
+class TranslationMemory:
+    """Lookup/store translated segments keyed by (src, tgt, model, segment hash)."""
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, texts, src, tgt, model):
+        """Return {index: translation} for every text found in memory."""
+        keys = [segment_key(src, tgt, model, t) for t in texts]
+        try:
+            found = self.store.get_many(list(set(keys)))
+        except Exception as e:
+            print(f"[TM] lookup failed, continuing without memory: {e}")
+            found = {}
+        out = {}
+        for i, (text, k) in enumerate(zip(texts, keys)):
+            if k in found:
+                out[i] = _rewrap(text, _decode(found[k]))
+        with self._lock:
+            self.hits += len(out)
+            self.misses += len(texts) - len(out)
+        return out
+
+    def store_many(self, pairs, src, tgt, model):
+        """Persist (source, translation) pairs."""
+        rows = {}
+        for text, translated in pairs:
+            rows[segment_key(src, tgt, model, text)] = _encode(str(translated).strip())
+        try:
+            self.store.put_many(list(rows.items()))
+        except Exception as e:
+            print(f"[TM] store failed: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_memory():
+    """Return the process-wide TranslationMemory, or None when disabled."""
+    global _memory
+    if _memory is not None:
+        return _memory or None
+    with _memory_lock:
+        if _memory is None:
+            url = os.environ.get("TRANSLATION_MEMORY_URL", DEFAULT_URL).strip()
+            if not url or url.lower() == "off":
+                _memory = False
+            elif url.startswith("redis://") or url.startswith("rediss://"):
+                _memory = TranslationMemory(_RedisStore(url, REDIS_TTL))
+            elif url.startswith("sqlite:///"):
+                _memory = TranslationMemory(_SQLiteStore(url[len("sqlite:///"):], MAX_ENTRIES))
+            else:
+                raise ValueError(f"Unsupported TRANSLATION_MEMORY_URL: {url}")
+    return _memory or None
+
+
+def log_stats(label: str):
+    """Print the running hit/miss counters after a job."""
+    memory = get_memory()
+    if memory:
+        print(f"[TM] {label}: {memory.stats()}")
@@ -0,0 +1,158 @@
+# Helpers shared by the XML-level OOXML (XLSX/DOCX) engines
+import copy
+import shutil
+import struct
+import tempfile
+import zipfile
+
+from lxml import etree
+
+# Parts larger than this are spooled to disk while being rewritten
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+_LOCAL_HEADER_SIZE = 30
+
+
+def _can_copy_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile) -> bool:
+    """Whether this Python's zipfile exposes the internals copy_entry_raw uses."""
+    return (hasattr(zipfile, "_strip_extra") and hasattr(zout, "_didModify")
+            and getattr(zin, "fp", None) is not None and getattr(zout, "fp", None) is not None)
+
+
+def copy_entry_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Copy one entry's compressed bytes from zin to zout without recompressing.
+
+    Falls back to a decompress/recompress copy when zipfile's private
+    helpers are not available.
+    """
+    if not _can_copy_raw(zin, zout):
+        zout.writestr(copy.copy(info), zin.read(info))
+        return
+
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(_LOCAL_HEADER_SIZE)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    zin.fp.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_len + extra_len)
+
+    new = copy.copy(info)
+    new.flag_bits &= ~0x08  # sizes and CRC go into the local header, no data descriptor
+    new.extra = zipfile._strip_extra(info.extra, (1,))  # FileHeader re-adds zip64 if needed
+    new.header_offset = zout.fp.tell()
+    zout.fp.write(new.FileHeader())
+
+    remaining = info.compress_size
+    while remaining:
+        block = zin.fp.read(min(remaining, 1024 * 1024))
+        if not block:
+            raise zipfile.BadZipFile(f"Truncated entry {info.filename}")
+        zout.fp.write(block)
+        remaining -= len(block)
+
+    zout.filelist.append(new)
+    zout.NameToInfo[new.filename] = new
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
+
+
+def rewrite_zip(in_path, out_path, replacements):
+    """Write a copy of the package at in_path to out_path.
+
+    `replacements` maps part names to readable binary file objects holding
+    the new content; those parts are deflated, every other entry is copied
+    as-is.
+    """
+    with zipfile.ZipFile(str(in_path)) as zin, \
+            zipfile.ZipFile(str(out_path), "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            new_part = replacements.get(info.filename)
+            if new_part is None:
+                copy_entry_raw(zin, zout, info)
+                continue
+            new_part.seek(0)
+            target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            target.compress_type = zipfile.ZIP_DEFLATED
+            target.external_attr = info.external_attr
+            with zout.open(target, "w", force_zip64=True) as dst:
+                shutil.copyfileobj(new_part, dst, 1024 * 1024)
+
+
+def spooled():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+def _start_tag(el) -> bytes:
+    """el's start tag with its attributes and in-scope namespace declarations."""
+    return etree.tostring(etree.Element(el.tag, dict(el.attrib), nsmap=el.nsmap))[:-2] + b">"
+
+
+def _tag_name(start_tag: bytes) -> bytes:
+    return start_tag[1:].split(None, 1)[0].rstrip(b"/>")
+
+
+def _undeclared(data: bytes, el) -> bytes:
+    """el serialized as `data`, without redeclaring the namespaces its parent already declared."""
+    parent = el.getparent()
+    if parent is None or el.nsmap != parent.nsmap:
+        return data
+    declared = etree.tostring(etree.Element(el.tag, nsmap=el.nsmap))[:-2]
+    if not data.startswith(declared):
+        return data
+    return b"<" + _tag_name(declared) + data[len(declared):]
+
+
+def _discard(el):
+    """Free an element already written out, keeping iterparse memory flat."""
+    el.clear()
+    parent = el.getparent()
+    if parent is not None:
+        parent.remove(el)
+
+
+def rewrite_part(fin, fout, item_tag, transform, container_tag=None):
+    """Stream an XML part from fin to fout, passing each `item_tag` element to transform.
+
+    Items are direct children of the root, or of `container_tag` (itself a
+    child of the root) when given, e.g. sst/si or worksheet/sheetData/row.
+    Everything else is written back unchanged. Namespaces are declared once,
+    on the root, as in the original part.
+    """
+    fout.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+    depth, open_tags = 0, []
+    container_open = False
+    for event, el in etree.iterparse(fin, events=("start", "end"), remove_blank_text=False, huge_tree=True):
+        if event == "start":
+            depth += 1
+            if depth == 1 or (depth == 2 and container_tag is not None and el.tag == container_tag):
+                tag = _undeclared(_start_tag(el), el)
+                container_open = depth == 2
+                fout.write(tag)
+                open_tags.append(_tag_name(tag))
+            continue
+
+        level, depth = depth, depth - 1
+        in_container = container_tag is not None and level == 3 and el.getparent().tag == container_tag
+        if level == 1:
+            fout.write(b"</" + open_tags.pop() + b">")
+        elif level == 2 and container_tag is not None and el.tag == container_tag:
+            fout.write(b"</" + open_tags.pop() + b">")
+            container_open = False
+            _discard(el)
+        elif el.tag == item_tag and ((container_tag is None and level == 2) or in_container):
+            transform(el)
+            fout.write(_undeclared(etree.tostring(el), el))
+            _discard(el)
+        elif level == 2 and not container_open:
+            fout.write(_undeclared(etree.tostring(el), el))
+            _discard(el)
+        elif in_container:
+            fout.write(_undeclared(etree.tostring(el), el))
+            _discard(el)
+
+
+def set_preserved_text(t_el, text):
+    """Set the text of a w:t / a:t element, keeping edge whitespace."""
+    t_el.text = text
+    if text != text.strip():
+        t_el.set(XML_SPACE, "preserve")
@@ -0,0 +1,103 @@
+# Passthrough classification for tabular translators (CSV/XLSX)
+#
+# Values that must not be translated (numbers, dates, currency amounts, URLs,
+# e-mails, IDs/SKUs, code identifiers, symbols) are detected over whole
+# columns at once with pandas instead of a float()/regex pair per cell.
+# Columns dominated by such values are skipped entirely.
+import os
+import numpy as np
+import pandas as pd
+
+# -------- configuration --------
+# Non-blank values sampled per column, and the passthrough share above which
+# the whole column is treated as non-translatable
+PROFILE_SAMPLE_ROWS = int(os.environ.get("PASSTHROUGH_SAMPLE_ROWS", "1000"))
+PROFILE_THRESHOLD = float(os.environ.get("PASSTHROUGH_COLUMN_THRESHOLD", "0.9"))
+
+TEXT = "text"
+
+# ISO 4217 codes written next to amounts ("USD 30", "1.200 EUR"); other
+# three-letter words ("100 PCS") are text
+_CURRENCY_CODES = "|".join([
+    "USD", "EUR", "GBP", "JPY", "CNY", "TRY", "CHF", "CAD", "AUD", "NZD", "INR", "RUB", "BRL", "MXN", "ZAR",
+    "SEK", "NOK", "DKK", "PLN", "CZK", "HUF", "RON", "KRW", "SGD", "HKD", "AED", "SAR", "ILS", "THB", "IDR",
+])
+
+# Checked in this order; the first matching kind wins
+_KINDS = [
+    ("currency", rf"(?:[$€£¥₺₹]|(?:{_CURRENCY_CODES}) )\s*[-+]?\d[\d,. ]*"
+                 rf"|[-+]?\d[\d,. ]*\s*(?:[$€£¥₺₹]| (?:{_CURRENCY_CODES}))"),
+    ("date", r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}(?:[T ]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+             r"|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}:\d{2}(?::\d{2})?(?: ?[AaPp][Mm])?"),
+    ("url", r"(?:https?://|ftp://|www\.)\S+"),
+    ("email", r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    ("id", r"(?=[^a-z]*\d)[A-Z0-9]+(?:[-_/.#][A-Z0-9]+)*"
+           r"|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"),
+    # snake_case, camelCase with a prefix of two or more letters (not "iPhone"
+    # or "eBay"), and calls whose arguments hold no free-standing words
+    ("code", r"[a-z][a-z0-9]*(?:_[a-z0-9]+)+|[a-z]{2,}(?:[A-Z][a-z0-9]+)+|[A-Za-z_][\w.]*\((?:[^()\s]|, )*\)"),
+    ("symbols", r"[\W_]+"),
+]
+# One regex, one pass: the named group that matched tells the kind
+_KIND_RE = "^(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in _KINDS) + ")$"
+_NON_FINITE = {"nan", "inf", "infinity"}
+
+
+def classify(values) -> np.ndarray:
+    """Kind of every value: "text" for translatable ones, else blank, numeric,
+    currency, date, url, email, id, code or symbols."""
+    s = pd.Series(list(values), dtype=object)
+    kinds = np.full(len(s), TEXT, dtype=object)
+    if s.empty:
+        return kinds
+    missing = s.isna().to_numpy()
+    s = s.where(~missing, "").astype(str)
+    stripped = s.str.strip()
+
+    matched = stripped.str.extract(_KIND_RE)
+    for name, _ in reversed(_KINDS):
+        kinds[matched[name].notna().to_numpy()] = name
+
+    # number-like, as float() sees it once grouping characters are removed
+    compact = stripped.str.replace(r"[,\s]|(?<=\d)_(?=\d)", "", regex=True).str.rstrip("%")
+    numeric = pd.to_numeric(compact, errors="coerce").notna()
+    numeric |= compact.str.lower().str.lstrip("+-").isin(_NON_FINITE)
+    kinds[numeric.to_numpy()] = "numeric"
+    kinds[missing | (stripped == "").to_numpy()] = "blank"
+    return kinds
+
+
+def passthrough_mask(values) -> np.ndarray:
+    """True where a value bypasses translation."""
+    return classify(values) != TEXT
+
+
+def profile_columns(frame: pd.DataFrame, sample_rows: int = None, threshold: float = None) -> dict:
+    """Per-column decision: {column: (translatable, dominant kind, passthrough share)}.
+
+    Up to `sample_rows` non-blank values of each column are classified; a
+    column whose passthrough share reaches `threshold` is not translatable.
+    """
+    sample_rows = sample_rows or PROFILE_SAMPLE_ROWS
+    threshold = threshold if threshold is not None else PROFILE_THRESHOLD
+    profile = {}
+    for column in frame.columns:
+        kinds = classify(frame[column].head(sample_rows * 4))
+        kinds = kinds[kinds != "blank"][:sample_rows]
+        if not len(kinds):
+            continue
+        names, counts = np.unique(kinds, return_counts=True)
+        share = float((kinds != TEXT).mean())
+        profile[column] = (share < threshold, str(names[counts.argmax()]), share)
+    return profile
+
+
+def skipped_columns(frame: pd.DataFrame, label: str) -> set:
+    """Columns of `frame` to leave untranslated; prints the decision for each column."""
+    skipped = set()
+    for column, (translatable, kind, share) in profile_columns(frame).items():
+        print(f"[{label}] column {column}: {'translate' if translatable else 'skip'} "
+              f"(mostly {kind}, {share:.0%} passthrough)")
+        if not translatable:
+            skipped.add(column)
+    return skipped
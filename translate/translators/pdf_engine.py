@@ -0,0 +1,118 @@
+# Warm PDF engine: pdf2zh/BabelDOC models loaded once per worker
+#
+# pdf2zh_next translates every PDF in a fresh subprocess whose BabelDOC
+# config loads the ONNX layout model again, so short PDFs mostly pay for
+# model start-up. A warm worker instead:
+#   - imports pdf2zh_next/BabelDOC/onnxruntime and fetches BabelDOC's assets
+#     in the prefork parent (celeryd_init), so children share those pages
+#     copy-on-write;
+#   - builds the layout model once per child (worker_process_init): ONNX
+#     Runtime sessions are not fork-safe, so the session itself is not shared;
+#   - runs BabelDOC in-process with that model for every job.
+# Memory of each step is printed at startup.
+import os
+import time
+from .rate_limit import GovernedRateLimiter
+from .utils import OUTPUT_RATIO
+
+# -------- configuration --------
+# PDF_ENGINE_PRELOAD: "1" warms workers consuming the pdf-heavy queue,
+# "always" warms every worker, "0" keeps pdf2zh's subprocess per job
+PDF_ENGINE_PRELOAD = os.environ.get("PDF_ENGINE_PRELOAD", "1").lower()
+PDF_QUEUE = "pdf-heavy"
+# Prompt tokens pdf2zh adds around each paragraph it sends, for the governor
+PDF_PROMPT_OVERHEAD = 200
+
+_preloaded = False
+_layout_model = None
+
+
+def _rss_mb() -> float:
+    import psutil
+
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _step(label, fn):
+    """Run one warm-up step and print its time and memory cost."""
+    before, started = _rss_mb(), time.monotonic()
+    result = fn()
+    after = _rss_mb()
+    print(f"[PDF engine] {label}: {time.monotonic() - started:.1f}s, "
+          f"RSS +{after - before:.0f} MB ({after:.0f} MB, pid {os.getpid()})")
+    return result
+
+
+def wanted(queues) -> bool:
+    """Whether a worker consuming `queues` should keep a warm PDF engine."""
+    if PDF_ENGINE_PRELOAD == "always":
+        return True
+    return PDF_ENGINE_PRELOAD in ("1", "true", "yes") and PDF_QUEUE in queues
+
+
+def preload_parent():
+    """Import the engine and fetch its assets before the pool forks."""
+    def imports():
+        import onnxruntime  # noqa: F401
+        import pdf2zh_next.high_level  # noqa: F401
+        from babeldoc.docvision import doclayout  # noqa: F401
+
+    def assets():
+        from babeldoc.assets.assets import warmup
+        warmup()
+
+    global _preloaded
+    _step("imports", imports)
+    _step("assets", assets)
+    _preloaded = True
+
+
+def is_preloaded() -> bool:
+    """Whether the parent preloaded the engine (inherited by forked children)."""
+    return _preloaded
+
+
+def load_models():
+    """Build the layout model once in this process and make BabelDOC reuse it."""
+    global _layout_model
+    if _layout_model is not None:
+        return _layout_model
+    from babeldoc.docvision.base_doclayout import DocLayoutModel
+
+    _layout_model = _step("layout model", DocLayoutModel.load_available)
+    return _layout_model
+
+
+def is_warm() -> bool:
+    return _layout_model is not None
+
+
+async def translate_stream(settings, original_pdf, governor=None):
+    """BabelDOC events for one PDF, translated in this process with the warm model.
+
+    Same events as pdf2zh_next's do_translate_async_stream (progress_update,
+    error, finish). With a rate governor, every request pdf2zh makes first
+    takes its tokens from it.
+    """
+    from babeldoc.docvision.base_doclayout import DocLayoutModel
+    from babeldoc.format.pdf.high_level import async_translate
+    from pdf2zh_next.high_level import create_babeldoc_config
+
+    settings.validate_settings()
+    # create_babeldoc_config passes doc_layout_model=None, which makes
+    # BabelDOC load a new model; hand it the warm one instead
+    load_available = DocLayoutModel.__dict__["load_available"]
+    DocLayoutModel.load_available = staticmethod(lambda: _layout_model)
+    try:
+        config = create_babeldoc_config(settings, original_pdf)
+    finally:
+        DocLayoutModel.load_available = load_available
+    if governor:
+        translator = config.translator
+        translator.rate_limiter = GovernedRateLimiter(governor, translator.rate_limiter, OUTPUT_RATIO,
+                                                      PDF_PROMPT_OVERHEAD)
+
+    async for event in async_translate(config):
+        yield event
+        if event["type"] in ("finish", "error"):
+            break
@@ -0,0 +1,94 @@
+# Page-range parallel PDF translation
+#
+# Long PDFs are cut into page ranges with pymupdf, each range is translated
+# by its own task (translate_pdf on a part file, which gets no analysis
+# artifact of its own), and the translated parts
+# are joined back in page order. The original's bookmarks and metadata are
+# copied onto the merged file when its page count still matches.
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import pymupdf
+
+# -------- configuration --------
+# PDFs with at least PDF_SPLIT_MIN_PAGES pages are split into parts of
+# PDF_PAGES_PER_PART pages; 0 disables splitting
+PDF_SPLIT_MIN_PAGES = int(os.environ.get("PDF_SPLIT_MIN_PAGES", "60"))
+PDF_PAGES_PER_PART = int(os.environ.get("PDF_PAGES_PER_PART", "30"))
+
+
+def page_ranges(page_count: int, pages_per_part: int = None) -> list:
+    """[start, end) page ranges covering page_count pages."""
+    pages_per_part = max(1, pages_per_part or PDF_PAGES_PER_PART)
+    return [(start, min(start + pages_per_part, page_count)) for start in range(0, page_count, pages_per_part)]
+
+
+def should_split(pdf_path) -> bool:
+    if PDF_SPLIT_MIN_PAGES <= 0 or Path(str(pdf_path)).suffix.lower() != ".pdf":
+        return False
+    try:
+        with pymupdf.open(str(pdf_path)) as doc:
+            return doc.page_count >= PDF_SPLIT_MIN_PAGES
+    except Exception:
+        # not a readable PDF; the regular path reports the error
+        return False
+
+
+def split(pdf_path, out_path) -> list:
+    """Write one part file per page range into a scratch directory next to
+    out_path; returns [(part_path, part_out_path, text_length)] in page order.
+
+    The text length (as the analysis counts it) lets each part be governed
+    without analysing the part files.
+    """
+    out_dir = Path(str(out_path)).parent
+    scratch = Path(tempfile.mkdtemp(prefix=".pdf-parts-", dir=str(out_dir)))
+    parts = []
+    try:
+        with pymupdf.open(str(pdf_path)) as doc:
+            for n, (start, end) in enumerate(page_ranges(doc.page_count)):
+                part = pymupdf.open()
+                part.insert_pdf(doc, from_page=start, to_page=end - 1)
+                part_path = scratch / f"part-{n:04d}.pdf"
+                part.save(str(part_path), garbage=3, deflate=True)
+                part.close()
+                length = sum(len(doc[i].get_text()) for i in range(start, end))
+                parts.append((str(part_path), str(scratch / f"part-{n:04d}.out.pdf"), length))
+    except Exception:
+        shutil.rmtree(str(scratch), ignore_errors=True)
+        raise
+    print(f"[PDF parts] {Path(str(pdf_path)).name}: {len(parts)} parts of up to {PDF_PAGES_PER_PART} pages")
+    return parts
+
+
+def merge(part_outputs, original_pdf, out_path) -> str:
+    """Join translated parts in order into out_path, keeping the original's
+    bookmarks and metadata where the page count allows."""
+    out_path = Path(str(out_path))
+    merged = pymupdf.open()
+    try:
+        for part in part_outputs:
+            with pymupdf.open(part) as doc:
+                merged.insert_pdf(doc)
+        with pymupdf.open(str(original_pdf)) as original:
+            if merged.page_count == original.page_count:
+                try:
+                    merged.set_toc(original.get_toc(simple=True))
+                except Exception as e:
+                    print(f"[PDF parts] could not copy bookmarks: {e}")
+            else:
+                print(f"[PDF parts] page count changed ({original.page_count} → {merged.page_count}), "
+                      f"bookmarks dropped")
+            merged.set_metadata(original.metadata or {})
+        # write next to out_path, then rename, so readers never see half a file
+        tmp = out_path.with_name(f".merging-{out_path.name}")
+        merged.save(str(tmp), garbage=3, deflate=True)
+    finally:
+        merged.close()
+    os.replace(str(tmp), str(out_path))
+    return str(out_path)
+
+
+def discard(scratch):
+    shutil.rmtree(str(scratch), ignore_errors=True)
@@ -1,53 +1,131 @@
+import asyncio
 import os
 from pathlib import Path
 import shutil
+import tempfile
 from typing import Optional
-from pdf2zh_next import WatermarkOutputMode, do_translate_file, SettingsModel
+from pdf2zh_next import WatermarkOutputMode, do_translate_async_stream, SettingsModel
+from ..utils.analysis import get_analysis
+from . import pdf_engine
+from .rate_limit import get_governor
+from .utils import MAX_INPUT_TOKENS, OUTPUT_RATIO
 
+# pdf2zh issues its own OpenAI calls; cap its request rate per job
+PDF_TRANSLATE_QPS = int(os.environ.get("PDF_TRANSLATE_QPS", "4"))
 
-def _find_generated_pdf(output_dir: Path, original_pdf: Path) -> Optional[Path]:
-    """Return the newest PDF in output_dir that is not the original file."""
-    candidates = [p for p in output_dir.glob("*.pdf") if p.name != original_pdf.name and p.is_file()]
-    if not candidates:
+
+def _governed_progress(governor, estimated_tokens: int, progress):
+    """Progress callback that debits the job's estimated tokens from the
+    governor as pdf2zh reports progress, at most one request's worth at a time.
+
+    Used when pdf2zh runs in its own subprocess, where its requests cannot be
+    governed one by one.
+    """
+    charged = [0]
+
+    def report(state):
+        due = int(estimated_tokens * min(100.0, state.get("percent") or 0) / 100)
+        while charged[0] < due:
+            step = min(due - charged[0], MAX_INPUT_TOKENS)
+            governor.acquire(step)
+            charged[0] += step
+        if progress is not None:
+            progress(state)
+
+    return report
+
+
+def _find_generated_pdf(scratch: Path, result) -> Optional[Path]:
+    """The translated PDF of a job: the path pdf2zh reports in its finish
+    event, else the job's only mono output in its own scratch directory."""
+    for attr in ("no_watermark_mono_pdf_path", "mono_pdf_path"):
+        path = getattr(result, attr, None)
+        if path and Path(path).is_file():
+            return Path(path)
+    candidates = sorted(scratch.glob("*.mono.pdf")) or sorted(scratch.glob("*.pdf"))
+    return candidates[0] if candidates else None
+
+
+def _translate_streaming(stream, progress):
+    """Drain a pdf2zh/BabelDOC event stream, forwarding its progress events to
+    `progress`. Returns the finish event's translate_result."""
+    async def run():
+        async for event in stream:
+            if event["type"] == "progress_update":
+                if progress is not None:
+                    progress({
+                        "percent": round(float(event.get("overall_progress") or 0), 1),
+                        "stage": event.get("stage"),
+                        "stage_done": event.get("stage_current"),
+                        "stage_total": event.get("stage_total"),
+                    })
+            elif event["type"] == "error":
+                raise RuntimeError(f"Translation error: {event.get('error', 'Unknown error')}")
+            elif event["type"] == "finish":
+                return event.get("translate_result")
         return None
-    return max(candidates, key=lambda p: p.stat().st_mtime)
 
+    return asyncio.run(run())
 
-def translate_pdf(pdf_path, out_path_str, src, tgt):
+
+def translate_pdf(pdf_path, out_path_str, src, tgt, progress=None, text_length=None):
+    """Translate a PDF with pdf2zh into out_path_str.
+
+    text_length: characters of the PDF's text layer when the caller knows
+    them (a split PDF's parts); otherwise they come from its analysis.
+    """
 
     # Prepare paths
     out_path = Path(out_path_str)
     out_path.parent.mkdir(parents=True, exist_ok=True)
     original_pdf = Path(pdf_path)
-    output_dir = out_path.parent
-
-    settings = SettingsModel(
-        basic={'input_files': {str(original_pdf)}},
-        translation={
-            'lang_in': src, 
-            'lang_out': tgt,
-            'output': str(output_dir),
-            'save_auto_extracted_glossary':False,
-            'no_auto_extract_glossary':True},
-        translate_engine_settings={
-            'translate_engine_type': 'OpenAI',
-            'openai_model':'gpt-4o-mini',
-            # 'openai_base_url':'https://generativelanguage.googleapis.com/v1beta/openai/', 
-            'openai_api_key': os.environ['OPENAI_API_KEY']
-            # Add your service-specific settings
-        },
-        pdf={'no_dual':True, 'watermark_output_mode':WatermarkOutputMode.NoWatermark},
-
-    )
-
-    error_count = do_translate_file(settings, ignore_error=False)
-
-    if error_count == 0:
-        generated = _find_generated_pdf(output_dir, original_pdf)
-        if generated and generated.exists():
-            try:
-                shutil.move(str(generated), str(out_path))
-            except Exception:
-                shutil.copy2(str(generated), str(out_path))
+
+    # pdf2zh's requests bypass llm_client: the warm engine takes each
+    # request's tokens from the shared governor, the subprocess path pays
+    # for the job's estimate in slices as it progresses
+    governor = get_governor()
+
+    # Each job writes into its own scratch directory next to out_path (same
+    # filesystem, so the final move is an atomic rename)
+    scratch = Path(tempfile.mkdtemp(prefix=".pdf-job-", dir=str(out_path.parent)))
+    try:
+        settings = SettingsModel(
+            translation={
+                'lang_in': src, 
+                'lang_out': tgt,
+                'output': str(scratch),
+                'save_auto_extracted_glossary':False,
+                'no_auto_extract_glossary':True,
+                'qps': PDF_TRANSLATE_QPS},
+            translate_engine_settings={
+                'translate_engine_type': 'OpenAI',
+                'openai_model':'gpt-4o-mini',
+                # 'openai_base_url':'https://generativelanguage.googleapis.com/v1beta/openai/', 
+                'openai_api_key': os.environ['OPENAI_API_KEY']
+                # Add your service-specific settings
+            },
+            pdf={'no_dual':True, 'watermark_output_mode':WatermarkOutputMode.NoWatermark},
+
+        )
+
+        if pdf_engine.is_warm():
+            # models already loaded in this worker (see pdf_engine)
+            stream = pdf_engine.translate_stream(settings, original_pdf, governor)
+        else:
+            stream = do_translate_async_stream(settings, original_pdf)
+            if governor:
+                if text_length is None:
+                    text_length = get_analysis(original_pdf)["text_length"]
+                prompt_tokens = text_length // 4
+                progress = _governed_progress(governor, prompt_tokens + int(prompt_tokens * OUTPUT_RATIO),
+                                              progress)
+        result = _translate_streaming(stream, progress)
+
+        generated = _find_generated_pdf(scratch, result)
+        if generated is None:
+            raise RuntimeError(f"PDF translation produced no output for {original_pdf.name}")
+        os.replace(str(generated), str(out_path))
+    finally:
+        shutil.rmtree(str(scratch), ignore_errors=True)
 
     return str(out_path)
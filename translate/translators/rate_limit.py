@@ -0,0 +1,159 @@
+# Cluster-wide requests/min + tokens/min governor shared by all workers
+import os
+import random
+import threading
+import time
+
+# -------- configuration --------
+# Limits are per provider account, shared by every Celery worker process.
+# 0 disables a bucket; with both at 0 the governor is off.
+RPM_LIMIT = int(os.environ.get("LLM_RPM_LIMIT", "0"))
+TPM_LIMIT = int(os.environ.get("LLM_TPM_LIMIT", "0"))
+# Redis holding the buckets; empty means the Celery broker
+RATE_LIMIT_URL = os.environ.get("LLM_RATE_LIMIT_URL", "")
+KEY_PREFIX = "llm-governor"
+MAX_WAIT = float(os.environ.get("LLM_RATE_LIMIT_MAX_WAIT", "300"))
+
+# Token buckets refilled continuously at limit/60 per second. Both buckets are
+# checked and debited atomically; returns 0 on success or the milliseconds to
+# wait before the request could fit.
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+    local key = KEYS[i]
+    local limit = tonumber(ARGV[2 * i])
+    local cost = tonumber(ARGV[2 * i + 1])
+    if limit > 0 then
+        local state = redis.call('HMGET', key, 'level', 'ts')
+        local level = tonumber(state[1]) or limit
+        local ts = tonumber(state[2]) or now
+        level = math.min(limit, level + (now - ts) * limit / 60000)
+        levels[i] = level
+        if level < cost then
+            wait = math.max(wait, math.ceil((cost - level) * 60000 / limit))
+        end
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i = 1, 2 do
+    local limit = tonumber(ARGV[2 * i])
+    if limit > 0 then
+        local cost = tonumber(ARGV[2 * i + 1])
+        redis.call('HSET', KEYS[i], 'level', levels[i] - cost, 'ts', now)
+        redis.call('PEXPIRE', KEYS[i], 120000)
+    end
+end
+return 0
+"""
+
+# Credit back (or charge) the token bucket once the real usage is known.
+_ADJUST = """
+local limit = tonumber(ARGV[1])
+local delta = tonumber(ARGV[2])
+local level = tonumber(redis.call('HGET', KEYS[1], 'level'))
+if level == nil then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'level', math.min(limit, level + delta))
+return 1
+"""
+
+
+class RateGovernor:
+    """Blocks callers until both the RPM and TPM buckets can cover a request."""
+
+    def __init__(self, redis_client, rpm: int, tpm: int):
+        self.redis = redis_client
+        self.rpm = rpm
+        self.tpm = tpm
+        self.keys = [f"{KEY_PREFIX}:rpm", f"{KEY_PREFIX}:tpm"]
+        self._acquire = redis_client.register_script(_ACQUIRE)
+        self._adjust = redis_client.register_script(_ADJUST)
+
+    def _now_ms(self) -> int:
+        seconds, micros = self.redis.time()
+        return seconds * 1000 + micros // 1000
+
+    def acquire(self, tokens: int):
+        """Wait until one request costing `tokens` fits under both limits."""
+        tokens = min(int(tokens), self.tpm) if self.tpm else 0
+        deadline = time.monotonic() + MAX_WAIT
+        while True:
+            wait_ms = self._acquire(keys=self.keys, args=[self._now_ms(), self.rpm, 1, self.tpm, tokens])
+            if not wait_ms:
+                return
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"LLM rate governor: waited more than {MAX_WAIT:.0f}s for capacity")
+            # jitter so throttled workers do not wake up together
+            time.sleep(int(wait_ms) / 1000 * random.uniform(1.0, 1.2))
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token bucket once the provider reports real usage."""
+        if self.tpm and actual is not None:
+            self._adjust(keys=[self.keys[1]], args=[self.tpm, min(int(estimated), self.tpm) - int(actual)])
+
+    def utilization(self) -> dict:
+        """Live bucket levels, as used/limit fractions over the last minute."""
+        now = self._now_ms()
+        out = {}
+        for name, key, limit in (("rpm", self.keys[0], self.rpm), ("tpm", self.keys[1], self.tpm)):
+            if not limit:
+                continue
+            level, ts = self.redis.hmget(key, "level", "ts")
+            level = float(level) if level is not None else limit
+            ts = int(ts) if ts is not None else now
+            available = min(limit, level + (now - ts) * limit / 60000)
+            out[name] = {
+                "limit": limit,
+                "available": int(available),
+                "utilization": round(1 - available / limit, 4),
+            }
+        return out
+
+
+class GovernedRateLimiter:
+    """pdf2zh/BabelDOC rate limiter that also takes each request's tokens from
+    the governor; `inner` (pdf2zh's own QPS limiter) still paces the job."""
+
+    def __init__(self, governor, inner=None, output_ratio: float = 1.0, overhead: int = 0):
+        self.governor = governor
+        self.inner = inner
+        self.output_ratio = output_ratio
+        self.overhead = overhead
+
+    def wait(self, rate_limit_params: dict = None):
+        tokens = int((rate_limit_params or {}).get("paragraph_token_count") or 0) + self.overhead
+        self.governor.acquire(tokens + int(tokens * self.output_ratio))
+        if self.inner is not None:
+            self.inner.wait(rate_limit_params)
+
+
+def rate_limit_url() -> str:
+    """LLM_RATE_LIMIT_URL, or the Celery broker when it is not set."""
+    if RATE_LIMIT_URL:
+        return RATE_LIMIT_URL
+    from django.conf import settings
+
+    return settings.CELERY_BROKER_URL
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return the process-wide RateGovernor, or None when no limits are set."""
+    global _governor
+    if not (RPM_LIMIT or TPM_LIMIT):
+        return None
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                import redis
+
+                _governor = RateGovernor(redis.Redis.from_url(rate_limit_url()), RPM_LIMIT, TPM_LIMIT)
+    return _governor
@@ -0,0 +1,116 @@
+# Fan-out/fan-in translation of one large document across workers
+#
+# plan() collects the document's segments with the format's payload
+# extractor (the ones the translator sends), dedupes and packs them the way
+# the translator does, and cuts the batches into shards of about
+# SHARD_SEGMENTS segments. Each shard is translated by its own task
+# (translate_shard), and merge() runs translate_file with every shard's
+# translations preloaded, so the output is written by the regular
+# CSV/XLSX/DOCX write-back code. Batches with a segment no shard returned are
+# translated live by the merge.
+import os
+from pathlib import Path
+from ..translator import translate_file
+from ..utils.analysis import get_analysis, segment_blocks
+from .checkpoint import TranslationsCheckpoint
+from .csv_translator import translate_csv_chunk
+from .docx_translator import BATCH_SIZE, translate_docx_chunk
+from .docx_xml_translator import docx_payloads
+from .passthrough import passthrough_mask
+from .utils import dedupe, packed, run_batches
+from .xlsx_sst_translator import xlsx_sst_payloads
+from .xlsx_translator import translate_xlsx_chunk, xlsx_engine
+
+# -------- configuration --------
+# Segments per shard; documents with more than this many distinct segments
+# are split across workers. 0 disables sharding.
+SHARD_SEGMENTS = int(os.environ.get("TRANSLATE_SHARD_SEGMENTS", "5000"))
+
+CHUNK_FNS = {
+    ".csv": translate_csv_chunk,
+    ".xlsx": translate_xlsx_chunk,
+    ".docx": translate_docx_chunk,
+}
+
+
+def should_shard(in_path) -> bool:
+    """Cheap pre-check on the upload's analysis before planning any batches."""
+    if SHARD_SEGMENTS <= 0 or Path(str(in_path)).suffix.lower() not in CHUNK_FNS:
+        return False
+    return get_analysis(in_path)["unique_segments"] > SHARD_SEGMENTS
+
+
+def _cells(in_path) -> list:
+    # the analysis holds the cells the CSV/XLSX translators consider, skipped columns left out
+    return [t for block in segment_blocks(in_path)
+            for t, passthrough in zip(block, passthrough_mask(block)) if not passthrough]
+
+
+def _segments(in_path) -> tuple:
+    """(segments the translator sends for in_path, its batch size)."""
+    ext = Path(str(in_path)).suffix.lower()
+    if ext == ".docx":
+        return docx_payloads(in_path), BATCH_SIZE
+    if ext == ".xlsx" and xlsx_engine(in_path) == "sst":
+        return xlsx_sst_payloads(in_path), None
+    return _cells(in_path), None
+
+
+def plan(in_path, src: str, tgt: str, shard_segments: int = None) -> list:
+    """The job's batches ({key: chunk}) cut into shards of about shard_segments
+    segments; a single shard means the job is not worth splitting."""
+    shard_segments = shard_segments or SHARD_SEGMENTS
+    segments, batch_size = _segments(in_path)
+    uniques, _ = dedupe(segments)
+    batches = {str(i): chunk for i, chunk in enumerate(packed(uniques, batch_size))}
+
+    shards, current, size = [], {}, 0
+    for key, chunk in batches.items():
+        if current and size + len(chunk) > shard_segments:
+            shards.append(current)
+            current, size = {}, 0
+        current[key] = chunk
+        size += len(chunk)
+    if current:
+        shards.append(current)
+    print(f"[SHARDS] {sum(len(b) for b in batches.values())} segments in {len(batches)} batches "
+          f"→ {len(shards)} shards")
+    return shards
+
+
+def translate_shard(in_path, batches: dict, src: str, tgt: str, concurrency: int = None, checkpoint=None) -> dict:
+    """Translate one shard's batches; returns {segment: translation}.
+
+    With the job checkpoint, results are kept under the shard's batch keys,
+    so a retried shard does not resend finished batches.
+    """
+    chunk_fn = CHUNK_FNS[Path(str(in_path)).suffix.lower()]
+    keys = list(batches)
+    results = run_batches(chunk_fn, [batches[k] for k in keys], src, tgt, concurrency,
+                          _KeyedCheckpoint(checkpoint, keys) if checkpoint is not None else None)
+    return {t: out for k, result in zip(keys, results) for t, out in zip(batches[k], result)}
+
+
+class _KeyedCheckpoint:
+    """Maps run_batches' positional indexes onto the shard's batch keys."""
+
+    def __init__(self, checkpoint, keys):
+        self.checkpoint = checkpoint
+        self.keys = keys
+
+    def get(self, index, chunk):
+        return self.checkpoint.get(self.keys[index], chunk)
+
+    def put(self, index, chunk, result):
+        self.checkpoint.put(self.keys[index], chunk, result)
+
+
+def merge(shard_results, in_path, out_path, src: str, tgt: str, concurrency: int = None) -> str:
+    """Write the translated file from every shard's translations."""
+    translations = {}
+    for shard in shard_results:
+        translations.update(shard or {})
+    checkpoint = TranslationsCheckpoint(translations)
+    out = translate_file(in_path, out_path, src, tgt, concurrency=concurrency, checkpoint=checkpoint)
+    print(f"[SHARDS] merged {len(shard_results)} shards ({checkpoint.resumed} batches preloaded) → {out}")
+    return out
@@ -1,18 +1,12 @@
 # Common utilities for all translators
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from itertools import islice
-from dotenv import load_dotenv
-from openai import OpenAI
 
-# -------- OpenAI client --------
-# Set OPENAI_API_KEY in your environment.
-load_dotenv()
-
-client = OpenAI(
-    api_key=os.environ['OPENAI_API_KEY'],
-
-    
-)
+# -------- Model --------
+# The OpenAI client lives in llm_client (built lazily on first call)
 MODEL = "gpt-4o-mini"
 
 # -------- Delimiters --------
@@ -35,3 +29,185 @@ def batched(it, n=80):
         if not chunk:
             break
         yield chunk
+
+
+# -------- token budgeting --------
+# Per-request budgets for the active model. The output budget stays well under
+# the model's completion limit so responses are never truncated.
+MODEL_TOKEN_BUDGETS = {
+    "gpt-4o-mini": {"input": 8000, "output": 8000},
+}
+_BUDGET = MODEL_TOKEN_BUDGETS.get(MODEL, MODEL_TOKEN_BUDGETS["gpt-4o-mini"])
+MAX_INPUT_TOKENS = int(os.environ.get("TRANSLATE_MAX_INPUT_TOKENS", 0)) or _BUDGET["input"]
+MAX_OUTPUT_TOKENS = int(os.environ.get("TRANSLATE_MAX_OUTPUT_TOKENS", 0)) or _BUDGET["output"]
+# Upper bound on segments per request, keeps index alignment manageable
+MAX_BATCH_ITEMS = int(os.environ.get("TRANSLATE_MAX_BATCH_ITEMS", "200"))
+# Expected target/source token ratio (translations often run longer)
+OUTPUT_RATIO = float(os.environ.get("TRANSLATE_OUTPUT_RATIO", "1.6"))
+# Per-segment wrapper cost, e.g. {"i": 12, "s": "..."} or a delimiter
+ITEM_OVERHEAD_TOKENS = 8
+
+
+@lru_cache(maxsize=None)
+def _encoding(model=MODEL):
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # BPE files are downloaded on first use; offline workers fall back
+        # to a character-based estimate
+        print(f"[tokens] tiktoken encoding unavailable, estimating by characters: {e}")
+        return None
+
+
+def count_tokens(text, model=MODEL) -> int:
+    """Number of tokens `text` costs for `model`"""
+    enc = _encoding(model)
+    if enc is None:
+        return len(str(text)) // 4 + 1
+    return len(enc.encode_ordinary(str(text)))
+
+
+def count_tokens_many(texts, model=MODEL) -> list:
+    """count_tokens for many texts at once (tiktoken encodes them in parallel)"""
+    texts = [str(t) for t in texts]
+    enc = _encoding(model)
+    if enc is None:
+        return [len(t) // 4 + 1 for t in texts]
+    return [len(tokens) for tokens in enc.encode_ordinary_batch(texts)]
+
+
+def packed(it, max_items=None, max_input_tokens=None, max_output_tokens=None):
+    """Split an iterable into batches that fit the per-request token budgets.
+
+    A batch closes when adding the next segment would exceed the input budget,
+    the estimated output budget, or `max_items`. A segment larger than the
+    budget is sent on its own.
+    """
+    counted = ((text, count_tokens(text)) for text in it)
+    for chunk in pack_counted(counted, max_items, max_input_tokens, max_output_tokens):
+        yield [text for text, _ in chunk]
+
+
+def pack_counted(pairs, max_items=None, max_input_tokens=None, max_output_tokens=None):
+    """packed() over (text, token_count) pairs whose tokens are already known."""
+    max_items = max_items or MAX_BATCH_ITEMS
+    max_in = max_input_tokens or MAX_INPUT_TOKENS
+    max_out = max_output_tokens or MAX_OUTPUT_TOKENS
+
+    chunk, used_in, used_out = [], 0, 0
+    for text, tokens in pairs:
+        cost_in = tokens + ITEM_OVERHEAD_TOKENS
+        cost_out = int(tokens * OUTPUT_RATIO) + ITEM_OVERHEAD_TOKENS
+        if chunk and (
+            len(chunk) >= max_items or used_in + cost_in > max_in or used_out + cost_out > max_out
+        ):
+            yield chunk
+            chunk, used_in, used_out = [], 0, 0
+        chunk.append((text, tokens))
+        used_in += cost_in
+        used_out += cost_out
+    if chunk:
+        yield chunk
+
+
+# -------- deduplication --------
+def dedupe(texts):
+    """Return (uniques, inverse) such that texts[i] == uniques[inverse[i]]"""
+    index, uniques, inverse = {}, [], []
+    for t in texts:
+        j = index.get(t)
+        if j is None:
+            j = index[t] = len(uniques)
+            uniques.append(t)
+        inverse.append(j)
+    return uniques, inverse
+
+
+def log_dedup(label, total, unique):
+    """Print how many segments the dedup stage saved for a job"""
+    ratio = (1 - unique / total) if total else 0.0
+    print(f"[{label}] dedup: {total} segments → {unique} unique ({ratio:.1%} removed)")
+
+
+# -------- concurrency --------
+# Number of chunk requests kept in flight per job. Set TRANSLATE_CONCURRENCY
+# per worker, or pass `concurrency=` per job.
+DEFAULT_CONCURRENCY = int(os.environ.get("TRANSLATE_CONCURRENCY", "4"))
+
+
+def run_batches(chunk_fn, batches, src, tgt, concurrency=None, checkpoint=None, progress=None):
+    """Run chunk_fn over batches with bounded concurrency.
+
+    Returns the per-batch results in the same order as `batches`. With a
+    checkpoint, batches completed by an earlier attempt are not re-sent and
+    each new result is saved as soon as it arrives. A Progress tracker is
+    advanced as each batch finishes.
+    """
+    batches = list(batches)
+    workers = max(1, int(concurrency or DEFAULT_CONCURRENCY))
+    if progress is not None:
+        progress.add(batches)
+
+    def run(index):
+        chunk = batches[index]
+        result = checkpoint.get(index, chunk) if checkpoint is not None else None
+        if result is None:
+            result = chunk_fn(chunk, src, tgt)
+            if checkpoint is not None:
+                checkpoint.put(index, chunk, result)
+        if progress is not None:
+            progress.advance(len(chunk))
+        return result
+
+    if workers == 1 or len(batches) <= 1:
+        return [run(i) for i in range(len(batches))]
+    with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+        return list(pool.map(run, range(len(batches))))
+
+
+# -------- progress --------
+class Progress:
+    """Batch and segment counters of one job, reported to `callback` as they move.
+
+    Totals grow as each run_batches call registers its batches (the streaming
+    CSV engine only learns its size chunk by chunk).
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.batches_done = self.batches_total = 0
+        self.segments_done = self.segments_total = 0
+        self._lock = threading.Lock()
+
+    def add(self, batches):
+        with self._lock:
+            self.batches_total += len(batches)
+            self.segments_total += sum(len(b) for b in batches)
+            state = self.snapshot()
+        self.callback(state)
+
+    def advance(self, segments: int):
+        with self._lock:
+            self.batches_done += 1
+            self.segments_done += segments
+            state = self.snapshot()
+        self.callback(state)
+
+    def snapshot(self) -> dict:
+        return {
+            "batches_done": self.batches_done,
+            "batches_total": self.batches_total,
+            "segments_done": self.segments_done,
+            "segments_total": self.segments_total,
+            "percent": round(100 * self.segments_done / self.segments_total, 1) if self.segments_total else 0.0,
+        }
+
+
+def tracked(callback):
+    """Progress tracker for an optional progress callback."""
+    return Progress(callback) if callback is not None else None
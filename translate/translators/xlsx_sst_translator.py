@@ -0,0 +1,180 @@
+# XLSX Translation Module (shared-strings engine)
+# Translates xl/sharedStrings.xml and inline strings in place without loading
+# the workbook object model. Formulas, styles and every other part are copied
+# byte-for-byte.
+import zipfile
+from pathlib import Path
+from lxml import etree
+from .llm_client import log_usage, usage_snapshot
+from .memory import log_stats
+from .ooxml import rewrite_part, rewrite_zip, set_preserved_text, spooled
+from .utils import dedupe, log_dedup, packed, run_batches, RUN_DELIM, tracked
+from .xlsx_translator import translate_xlsx_chunk
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+SI, T, R, RPH, IS, C, ROW, SHEET_DATA = (
+    f"{NS}si", f"{NS}t", f"{NS}r", f"{NS}rPh", f"{NS}is", f"{NS}c", f"{NS}row", f"{NS}sheetData"
+)
+
+SHARED_STRINGS = "xl/sharedStrings.xml"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+
+def _shared_strings_part(zin):
+    """Resolve the shared-strings part name from the workbook relationships."""
+    try:
+        rels = etree.fromstring(zin.read(WORKBOOK_RELS))
+    except KeyError:
+        return SHARED_STRINGS
+    for rel in rels.iter(REL):
+        if rel.get("Type", "").endswith("/sharedStrings"):
+            target = rel.get("Target", "")
+            return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    return None
+
+
+def _text_nodes(string_item):
+    """The t elements of an si/is item, skipping phonetic (rPh) runs."""
+    direct = string_item.find(T)
+    if direct is not None:
+        return [direct]
+    return [r.find(T) for r in string_item.findall(R) if r.find(T) is not None]
+
+
+def _item_text(string_item) -> str:
+    return "".join(t.text or "" for t in _text_nodes(string_item))
+
+
+def _item_payload(string_item) -> str:
+    """What is sent for an si/is item: rich-text runs are joined with RUN_DELIM
+    so each run keeps its own formatting, as DOCX paragraphs do."""
+    nodes = _text_nodes(string_item)
+    if len(nodes) < 2:
+        return _item_text(string_item)
+    # normalize empty runs so the run count stays stable
+    return RUN_DELIM.join(t.text or " " for t in nodes)
+
+
+def _set_item_text(string_item, text):
+    """Write a translated payload back into an si/is item, one part per run."""
+    nodes = _text_nodes(string_item)
+    if not nodes:
+        return
+    parts = text.split(RUN_DELIM)
+    if len(nodes) == 1:
+        set_preserved_text(nodes[0], "".join(parts))
+        return
+    k = min(len(nodes), len(parts))
+    for i in range(k):
+        set_preserved_text(nodes[i], parts[i])
+    for t in nodes[k:]:
+        t.text = ""
+    # more parts than runs: the extras go to the last run
+    if len(parts) > k:
+        set_preserved_text(nodes[k - 1], "".join(parts[k - 1:]))
+
+
+def _is_translatable(payload: str) -> bool:
+    s = payload.replace(RUN_DELIM, "").strip()
+    return bool(s) and not s.startswith("=")
+
+
+def _inline_sheets(zin):
+    """Worksheet parts that contain inline strings."""
+    names = []
+    for name in zin.namelist():
+        if not (name.startswith("xl/worksheets/") and name.endswith(".xml")):
+            continue
+        with zin.open(name) as f:
+            tail = b""
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                if b'"inlineStr"' in tail + block:
+                    names.append(name)
+                    break
+                tail = block[-16:]
+    return names
+
+
+def _iter_items(fileobj, tag):
+    """Yield the payload of every `tag` element, freeing parsed si/row elements as we go."""
+    for _, el in etree.iterparse(fileobj, events=("end",), tag=(tag, ROW), huge_tree=True):
+        if el.tag == tag:
+            yield _item_payload(el)
+        if el.tag in (SI, ROW):
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+
+def _inline_cells(row):
+    return [c.find(IS) for c in row.findall(C) if c.get("t") == "inlineStr" and c.find(IS) is not None]
+
+
+def _payloads(zin, sst_name, has_sst, inline_sheets) -> list:
+    texts = []
+    if has_sst:
+        with zin.open(sst_name) as f:
+            texts.extend(t for t in _iter_items(f, SI) if _is_translatable(t))
+    for name in inline_sheets:
+        with zin.open(name) as f:
+            texts.extend(t for t in _iter_items(f, IS) if _is_translatable(t))
+    return texts
+
+
+def xlsx_sst_payloads(in_path) -> list:
+    """Payloads translate_xlsx_sst would send for in_path, in part order."""
+    with zipfile.ZipFile(str(in_path)) as zin:
+        sst_name = _shared_strings_part(zin)
+        return _payloads(zin, sst_name, sst_name in set(zin.namelist()), _inline_sheets(zin))
+
+
+def translate_xlsx_sst(in_path: Path, out_path: Path, src: str, tgt: str, batch_size: int = None,
+                       concurrency: int = None, checkpoint=None, progress=None):
+    """Translate an XLSX file at the shared-strings level"""
+    usage = usage_snapshot()
+    with zipfile.ZipFile(str(in_path)) as zin:
+        sst_name = _shared_strings_part(zin)
+        has_sst = sst_name in set(zin.namelist())
+        inline_sheets = _inline_sheets(zin)
+
+        texts = _payloads(zin, sst_name, has_sst, inline_sheets)
+        uniques, _ = dedupe(texts)
+        log_dedup("XLSX", len(texts), len(uniques))
+        translated = []
+        for chunk_out in run_batches(translate_xlsx_chunk, packed(uniques, batch_size), src, tgt, concurrency,
+                                     checkpoint, tracked(progress)):
+            translated.extend(chunk_out)
+        lookup = dict(zip(uniques, translated))
+
+        def translate_item(string_item):
+            payload = _item_payload(string_item)
+            if payload in lookup:
+                _set_item_text(string_item, lookup[payload])
+
+        def translate_row(row):
+            for string_item in _inline_cells(row):
+                translate_item(string_item)
+
+        replacements = {}
+        if has_sst:
+            out = replacements[sst_name] = spooled()
+            with zin.open(sst_name) as f:
+                rewrite_part(f, out, SI, translate_item)
+        for name in inline_sheets:
+            out = replacements[name] = spooled()
+            with zin.open(name) as f:
+                rewrite_part(f, out, ROW, translate_row, container_tag=SHEET_DATA)
+
+    try:
+        rewrite_zip(in_path, out_path, replacements)
+    finally:
+        for part in replacements.values():
+            part.close()
+
+    print(f"Translated XLSX ({len(texts)} strings, shared-strings engine) → {out_path}")
+    log_stats("XLSX")
+    log_usage("XLSX", usage)
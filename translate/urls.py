@@ -11,4 +11,6 @@ urlpatterns = [
     path('upload/translate', views3.start_translate, name='start_translate'),
     path('upload/download/<str:task_id>/', views3.download_file, name='download_file'),
     path('upload/ajax-status/<str:task_id>/', views3.ajax_task_status, name='ajax_task_status'),
+    path('upload/events/<str:task_id>/', views3.task_events, name='task_events'),
+    path('upload/llm-rate/', views3.llm_rate_status, name='llm_rate_status'),
 ]
\ No newline at end of file
@@ -0,0 +1,272 @@
+# Extract-once document analysis shared by pricing, charging and translation
+#
+# An uploaded file is parsed once, when the upload completes, into a small
+# orjson header keyed by the file's content hash: its text length (what the
+# price is based on), segment counts and PDF pre-check. Its distinct
+# translatable segments go into a JSON-lines file next to it, written while
+# the document is streamed, so callers that only need the length or a count
+# (routing, start_translate, get_price, sharding) never load them. A per-path
+# pointer validated by size and mtime saves re-hashing the file on every lookup.
+import csv
+import hashlib
+import os
+import tempfile
+from itertools import chain, islice
+from pathlib import Path
+import orjson
+from .pdf_preflight import preflight as pdf_preflight, REJECTED_KINDS
+from .text_length_calculator import pdf_page_texts
+
+# -------- configuration --------
+# TRANSLATE_ANALYSIS_DIR defaults to ./analysis next to manage.py
+ANALYSIS_DIR = Path(os.environ.get(
+    "TRANSLATE_ANALYSIS_DIR", str(Path(__file__).resolve().parents[2] / "analysis")))
+ANALYSIS_VERSION = 6
+# Segments handled at a time by callers that stream them in blocks
+SEGMENT_BLOCK = int(os.environ.get("ANALYSIS_SEGMENT_BLOCK", "10000"))
+
+
+def file_hash(path) -> str:
+    """sha256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(str(path), "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write-then-rename so concurrent readers never see half an artifact
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(orjson.dumps(data))
+    os.replace(tmp, path)
+
+
+def _read(path: Path):
+    try:
+        return orjson.loads(path.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+def _pointer_path(path) -> Path:
+    key = hashlib.sha1(os.path.abspath(str(path)).encode("utf-8")).hexdigest()
+    return ANALYSIS_DIR / "by-path" / f"{key}.json"
+
+
+def content_hash(path) -> str:
+    """Content hash of path, reusing the one recorded at analysis time when the file is unchanged."""
+    st = os.stat(str(path))
+    pointer = _read(_pointer_path(path))
+    if pointer and pointer.get("size") == st.st_size and pointer.get("mtime_ns") == st.st_mtime_ns:
+        return pointer["sha256"]
+    digest = file_hash(path)
+    _write(_pointer_path(path), {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return digest
+
+
+# -------- extraction --------
+# Each extractor is a generator: it yields the translatable segments in
+# document order and returns the text length. The length counts every text
+# cell, as the price always has; CSV/XLSX segments leave out the cells of
+# columns the translators skip.
+
+def _skipped(sample, label) -> set:
+    # Import here to avoid circular imports
+    import pandas as pd
+    from ..translators.passthrough import skipped_columns
+
+    return skipped_columns(pd.DataFrame(sample), label)
+
+
+def _unskipped(rows, label):
+    """Texts of rows ((raw values, [(column, text)]) pairs, header row first)
+    outside the columns the translators skip.
+
+    Same rule as the translators: columns are profiled on the rows below the
+    header, and a skipped column keeps its header cell. Only the profiled
+    rows are held in memory.
+    """
+    from ..translators.passthrough import PROFILE_SAMPLE_ROWS
+
+    rows = iter(rows)
+    head = list(islice(rows, 4 * PROFILE_SAMPLE_ROWS + 1))
+    skipped = _skipped([raw for raw, _ in head[1:]], label)
+    for r, (_, cells) in enumerate(chain(head, rows)):
+        for c, text in cells:
+            if r == 0 or c not in skipped:
+                yield text
+
+
+def _extract_csv(path):
+    # Import here to avoid circular imports
+    from ..translators.csv_translator import _sniff_dialect
+
+    length = 0
+
+    def rows(f):
+        nonlocal length
+        for row in csv.reader(f, _sniff_dialect(path)):
+            length += sum(len(cell) + 1 for cell in row)
+            yield row, [(c, cell) for c, cell in enumerate(row) if cell.strip()]
+
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from _unskipped(rows(f), "CSV")
+    return length
+
+
+def _extract_xlsx(path):
+    from openpyxl import load_workbook
+
+    length = 0
+
+    def rows(ws):
+        nonlocal length
+        for row in ws.iter_rows(min_row=ws.min_row, values_only=True):
+            # same rule as the translator: text cells only, no formulas
+            cells = [(c, v) for c, v in enumerate(row)
+                     if isinstance(v, str) and v.strip() and not v.strip().startswith("=")]
+            length += sum(len(v) + 1 for _, v in cells)
+            yield row, cells
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield from _unskipped(rows(ws), f"XLSX {ws.title}")
+    finally:
+        wb.close()
+    return length
+
+
+def _extract_docx(path):
+    # Import here to avoid circular imports
+    from ..translators.docx_xml_translator import docx_payloads
+    from ..translators.utils import RUN_DELIM
+
+    segments = docx_payloads(path)
+    yield from segments
+    return sum(len(s.replace(RUN_DELIM, "")) + 1 for s in segments)
+
+
+def _extract_pdf(path):
+    texts = pdf_page_texts(path)
+    yield from (t for t in texts if t.strip())
+    return sum(len(t) for t in texts)
+
+
+EXTRACTORS = {
+    ".csv": _extract_csv,
+    ".xlsx": _extract_xlsx,
+    ".docx": _extract_docx,
+    ".pdf": _extract_pdf,
+}
+
+
+def measure(path) -> tuple:
+    """(text length, segment count) of path from one streaming pass; nothing is stored."""
+    extractor = EXTRACTORS[os.path.splitext(str(path))[1].lower()](str(path))
+    count = 0
+    while True:
+        try:
+            next(extractor)
+        except StopIteration as done:
+            return done.value, count
+        count += 1
+
+
+def _segments_path(digest: str) -> Path:
+    return ANALYSIS_DIR / f"{digest}.segments.jsonl"
+
+
+def _write_segments(digest: str, segments) -> tuple:
+    """Stream the distinct segments to their JSON-lines file; returns (segments, distinct)."""
+    path = _segments_path(digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # distinct segments are told apart by a short digest, not kept as strings
+    seen, total = set(), 0
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        for segment in segments:
+            total += 1
+            key = hashlib.blake2b(segment.encode("utf-8"), digest_size=16).digest()
+            if key not in seen:
+                seen.add(key)
+                f.write(orjson.dumps(segment) + b"\n")
+    os.replace(tmp, path)
+    return total, len(seen)
+
+
+def analyze(path, preflight: dict = None) -> dict:
+    """Parse path once and store its analysis; returns the header.
+
+    PDFs carry their text-layer pre-check (`preflight`, run here unless the
+    caller already has it); rejected ones are not extracted.
+    """
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext not in EXTRACTORS:
+        raise ValueError(f"Unsupported file type: {ext}")
+    digest = content_hash(path)
+    if ext == ".pdf":
+        preflight = preflight or pdf_preflight(path)
+    length = 0
+
+    def extracted():
+        nonlocal length
+        if not (preflight and preflight["kind"] in REJECTED_KINDS):
+            length = yield from EXTRACTORS[ext](str(path))
+
+    # segments first, so a header on disk always has its segments file
+    total, distinct = _write_segments(digest, extracted())
+    data = {
+        "version": ANALYSIS_VERSION,
+        "sha256": digest,
+        "ext": ext,
+        "text_length": length,
+        "segment_count": total,
+        "unique_segments": distinct,
+        "preflight": preflight,
+    }
+    _write(ANALYSIS_DIR / f"{digest}.json", data)
+    return data
+
+
+def get_analysis(path) -> dict:
+    """Analysis header of path, extracting it now if the upload path did not."""
+    digest = content_hash(path)
+    data = _read(ANALYSIS_DIR / f"{digest}.json")
+    if data is None or data.get("version") != ANALYSIS_VERSION:
+        return analyze(path)
+    return data
+
+
+def segment_blocks(path, size: int = None):
+    """iter_segments(path) in lists of up to `size` segments, for vectorised passes."""
+    size = size or SEGMENT_BLOCK
+    segments = iter_segments(path)
+    while block := list(islice(segments, size)):
+        yield block
+
+
+def iter_segments(path):
+    """Distinct translatable segments of path, in document order, read from its analysis."""
+    digest = get_analysis(path)["sha256"]
+    try:
+        f = open(_segments_path(digest), "rb")
+    except FileNotFoundError:
+        analyze(path)
+        f = open(_segments_path(digest), "rb")
+    with f:
+        for line in f:
+            yield orjson.loads(line)
+
+
+def derived(analysis: dict, name: str, build) -> dict:
+    """Result of build() kept next to an analysis artifact, built once per artifact and name."""
+    path = ANALYSIS_DIR / "derived" / f"{analysis['sha256']}-{name}.json"
+    data = _read(path)
+    if data is None or data.get("version") != ANALYSIS_VERSION:
+        data = dict(build(), version=ANALYSIS_VERSION)
+        _write(path, data)
+    return data
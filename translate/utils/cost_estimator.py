@@ -0,0 +1,107 @@
+# Token-level cost estimate that mirrors what the translators actually send
+#
+# Works off the analysis segments, which follow the translators' own
+# extraction (CSV/XLSX cells, DOCX paragraph payloads, PDF pages). They are
+# streamed in blocks and packed with the translators' batching rules; CSV/XLSX
+# passthrough cells are dropped with the translators' own classifier (skipped
+# columns are already left out of the analysis). The token counts are kept
+# next to the analysis, per language pair, so repeated quotes do not recount them.
+import hashlib
+import json
+import os
+from .analysis import derived, get_analysis, segment_blocks
+
+# -------- configuration --------
+# USD per million tokens for the translation model
+INPUT_PRICE_PER_MTOK = float(os.environ.get("LLM_INPUT_PRICE_PER_MTOK", "0.15"))
+OUTPUT_PRICE_PER_MTOK = float(os.environ.get("LLM_OUTPUT_PRICE_PER_MTOK", "0.60"))
+# Completion tokens spent on the tool call / reply wrapper of each request
+RESPONSE_OVERHEAD_TOKENS = 20
+
+
+def _counted(blocks, keep=None):
+    """(segment, tokens) pairs over blocks of segments, dropping those keep() masks out."""
+    from ..translators.utils import count_tokens_many
+
+    for block in blocks:
+        if keep is not None:
+            block = [t for t, kept in zip(block, keep(block)) if kept]
+        yield from zip(block, count_tokens_many(block))
+
+
+def _tabular(blocks, src, tgt):
+    # Import here to avoid circular imports
+    from ..translators.cells import chunk_request
+    from ..translators.passthrough import passthrough_mask
+    from ..translators.utils import count_tokens, ITEM_OVERHEAD_TOKENS, OUTPUT_RATIO, pack_counted
+
+    request = chunk_request([""], [], src, tgt)
+    overhead = sum(count_tokens(m["content"]) for m in request["messages"]) + count_tokens(json.dumps(request["tools"]))
+
+    # passthrough cells never reach the batches
+    requests = sent = prompt = completion = 0
+    for chunk in pack_counted(_counted(blocks, lambda block: ~passthrough_mask(block))):
+        asked = [t for _, t in chunk]
+        requests += 1
+        sent += len(asked)
+        prompt += overhead + sum(asked) + ITEM_OVERHEAD_TOKENS * len(asked)
+        completion += RESPONSE_OVERHEAD_TOKENS + sum(int(t * OUTPUT_RATIO) + ITEM_OVERHEAD_TOKENS for t in asked)
+    return requests, sent, prompt, completion
+
+
+def _docx(blocks, src, tgt):
+    # Import here to avoid circular imports
+    from ..translators.docx_translator import BATCH_SIZE, chunk_request
+    from ..translators.utils import count_tokens, OUTPUT_RATIO, pack_counted, PARA_DELIM
+
+    overhead = sum(count_tokens(m["content"]) for m in chunk_request([], src, tgt)["messages"])
+    delim = count_tokens(PARA_DELIM)
+
+    requests = sent = prompt = completion = 0
+    for chunk in pack_counted(_counted(blocks), BATCH_SIZE):
+        body = sum(t for _, t in chunk) + delim * (len(chunk) - 1)
+        requests += 1
+        sent += len(chunk)
+        prompt += overhead + body
+        completion += RESPONSE_OVERHEAD_TOKENS + int(body * OUTPUT_RATIO)
+    return requests, sent, prompt, completion
+
+
+def _pdf(blocks):
+    # pdf2zh batches paragraphs itself; one request per page is the rough count
+    from ..translators.utils import OUTPUT_RATIO
+
+    pages = prompt = 0
+    for _, tokens in _counted(blocks):
+        pages += 1
+        prompt += tokens
+    return pages, pages, prompt, int(prompt * OUTPUT_RATIO)
+
+
+def _count(path, analysis: dict, src: str, tgt: str) -> dict:
+    blocks, ext = segment_blocks(path), analysis["ext"]
+    if ext in (".csv", ".xlsx"):
+        requests, sent, prompt, completion = _tabular(blocks, src, tgt)
+    elif ext == ".docx":
+        requests, sent, prompt, completion = _docx(blocks, src, tgt)
+    else:
+        requests, sent, prompt, completion = _pdf(blocks)
+    return {
+        "segments": analysis["unique_segments"],
+        "sent_segments": sent,
+        "requests": requests,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+    }
+
+
+def estimate_cost(path, src: str = "English", tgt: str = "Turkish") -> dict:
+    """Expected requests, tokens and API cost of translating path."""
+    analysis = get_analysis(path)
+    pair = hashlib.sha1(f"{src}\n{tgt}".encode("utf-8")).hexdigest()[:16]
+    counts = derived(analysis, f"estimate-{pair}", lambda: _count(path, analysis, src, tgt))
+    estimate = {k: v for k, v in counts.items() if k != "version"}
+    cost = (estimate["prompt_tokens"] * INPUT_PRICE_PER_MTOK
+            + estimate["completion_tokens"] * OUTPUT_PRICE_PER_MTOK) / 1_000_000
+    estimate["api_cost"] = round(cost, 6)
+    return estimate
@@ -0,0 +1,88 @@
+# Fast text-layer pre-check for uploaded PDFs
+#
+# Samples a handful of pages spread over the document and measures how much
+# extractable text each one has, so image-only (scanned), empty or unreadable
+# PDFs are turned away when the upload completes, before they are priced,
+# charged and queued, instead of failing inside pdf2zh on a heavy worker.
+import os
+import time
+import pymupdf
+
+# -------- configuration --------
+# Pages sampled per document, and the characters a page needs to count as text
+PREFLIGHT_SAMPLE_PAGES = int(os.environ.get("PDF_PREFLIGHT_SAMPLE_PAGES", "12"))
+PREFLIGHT_MIN_CHARS = int(os.environ.get("PDF_PREFLIGHT_MIN_CHARS", "50"))
+# Share of non-blank sampled pages with text above which a PDF is "text"
+PREFLIGHT_TEXT_SHARE = 0.8
+
+TEXT, MIXED, SCANNED, EMPTY, ENCRYPTED, CORRUPT = "text", "mixed", "scanned", "empty", "encrypted", "corrupt"
+REJECTED_KINDS = {SCANNED, EMPTY, ENCRYPTED, CORRUPT}
+
+MESSAGES = {
+    SCANNED: "This PDF contains only scanned images and no selectable text, so it cannot be translated. "
+             "Please upload a PDF with a text layer (run OCR on it first).",
+    EMPTY: "This PDF contains no extractable text to translate.",
+    ENCRYPTED: "This PDF is password-protected. Please upload an unlocked copy.",
+    CORRUPT: "This PDF could not be read. It may be damaged; please export it again and re-upload.",
+    MIXED: "Some pages of this PDF are scanned images; those pages will not be translated.",
+}
+
+
+def sample_pages(page_count: int, n: int = None) -> list:
+    """Up to n page indexes spread evenly over the document, first and last included."""
+    n = max(1, n or PREFLIGHT_SAMPLE_PAGES)
+    if page_count <= n:
+        return list(range(page_count))
+    if n == 1:
+        return [0]
+    return sorted({round(i * (page_count - 1) / (n - 1)) for i in range(n)})
+
+
+def _result(kind, started, **details) -> dict:
+    return dict(kind=kind, elapsed_ms=round((time.perf_counter() - started) * 1000, 1), **details)
+
+
+def preflight(path) -> dict:
+    """Classify a PDF as text, mixed, scanned, empty, encrypted or corrupt
+    from a sample of its pages."""
+    started = time.perf_counter()
+    try:
+        doc = pymupdf.open(str(path))
+    except Exception as e:
+        return _result(CORRUPT, started, error=str(e))
+
+    with doc:
+        if doc.needs_pass:
+            return _result(ENCRYPTED, started)
+        if doc.page_count == 0:
+            return _result(CORRUPT, started, error="no pages")
+
+        text_pages = image_pages = 0
+        chars = []
+        try:
+            for i in sample_pages(doc.page_count):
+                page = doc[i]
+                n = len("".join(page.get_text().split()))
+                chars.append(n)
+                has_images = bool(page.get_images())
+                # a short caption on a full-page scan still counts as an image page
+                if n >= PREFLIGHT_MIN_CHARS or (n and not has_images):
+                    text_pages += 1
+                elif has_images:
+                    image_pages += 1
+        except Exception as e:
+            return _result(CORRUPT, started, error=str(e))
+
+        if not text_pages:
+            kind = SCANNED if image_pages else EMPTY
+        elif text_pages / (text_pages + image_pages) >= PREFLIGHT_TEXT_SHARE:
+            kind = TEXT
+        else:
+            kind = MIXED
+        return _result(kind, started, pages=doc.page_count, sampled=len(chars), text_pages=text_pages,
+                       image_pages=image_pages, chars_per_page=round(sum(chars) / len(chars), 1))
+
+
+def message(result) -> str:
+    """User-facing explanation for a rejected or mixed PDF, else ''."""
+    return MESSAGES.get(result["kind"], "") if result else ""
@@ -1,57 +1,54 @@
-import csv
-import pymupdf
-from docx import Document
-import openpyxl
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+import pymupdf
+
+# PDFs with at least this many pages are split into page ranges counted in
+# parallel worker processes. PDF_LENGTH_WORKERS=1 keeps it in-process.
+PDF_LENGTH_WORKERS = int(os.environ.get("PDF_LENGTH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "64"))
 
 
 def calculate_length(filepath):
+    """Text length of a document, from the same extraction the analysis uses."""
+    # Import here to avoid circular imports
+    from .analysis import EXTRACTORS, measure
+
     _, extension = os.path.splitext(filepath)
-    extension = extension.lower()
-    if extension == ".pdf":
-        return calculate_length_pdf(filepath)
-
-    elif extension == ".docx":
-        return calculate_length_docx(filepath)
-
-    elif extension ==".xlsx":
-        return calculate_length_xlsx(filepath)
-
-    elif extension == ".csv":
-        return calculate_length_csv(filepath)
-
-
-def calculate_length_pdf(filepath):
-    doc = pymupdf.open(filepath)
-    total_text = ""
-    for page in doc:
-        total_text += page.get_text()
-    doc.close()
-    return len(total_text)
-
-def calculate_length_docx(filepath):
-    doc = Document(filepath)
-    total_text = ""
-    for para in doc.paragraphs:
-        total_text += para.text + " "
-    
-    return len(total_text)
-
-def calculate_length_xlsx(filepath):
-    workbook = openpyxl.load_workbook(filepath, data_only=True)
-    total_text = ""
-    for sheet in workbook.worksheets:
-      for row in sheet.iter_rows():
-        for cell in row:
-            if cell.value is not None:
-                total_text += str(cell.value) + " "
-    return len(total_text)
-
-def calculate_length_csv(filepath):
-    total_text = ""
-    with open(filepath, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            for cell in row:
-                total_text += str(cell) + " "
-    return len(total_text)
+    if extension.lower() in EXTRACTORS:
+        return measure(filepath)[0]
+
+
+def _pdf_range(filepath, start, stop, keep_text=False):
+    """Text length (and optionally texts) of pages [start, stop)."""
+    length, texts = 0, []
+    with pymupdf.open(filepath) as doc:
+        for i in range(start, stop):
+            text = doc[i].get_text()
+            length += len(text)
+            if keep_text:
+                texts.append(text)
+    return length, texts
+
+
+def _pdf_ranges(filepath, keep_text=False, workers=None):
+    """Per-range (length, texts) in page order, fanned out over processes for long PDFs."""
+    with pymupdf.open(filepath) as doc:
+        pages = doc.page_count
+    workers = max(1, int(workers or PDF_LENGTH_WORKERS))
+    # daemonic processes (Celery prefork children) cannot start a pool
+    if workers == 1 or pages < PDF_PARALLEL_MIN_PAGES or multiprocessing.current_process().daemon:
+        return [_pdf_range(filepath, 0, pages, keep_text)]
+    step = -(-pages // workers)
+    bounds = [(start, min(pages, start + step)) for start in range(0, pages, step)]
+    # spawn, not fork: this runs inside the web process, whose threads and
+    # sockets must not be copied into the children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(bounds), mp_context=context) as pool:
+        futures = [pool.submit(_pdf_range, filepath, start, stop, keep_text) for start, stop in bounds]
+        return [f.result() for f in futures]
+
+
+def pdf_page_texts(filepath, workers=None):
+    """Text of every page, in order."""
+    return [text for _, texts in _pdf_ranges(filepath, True, workers) for text in texts]
@@ -1,3 +1,5 @@
+import asyncio
+import json
 from decimal import Decimal
 import os
 import tempfile
@@ -5,20 +7,25 @@ from pathlib import Path
 
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
-from django.http import HttpResponse, FileResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, FileResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.cache import cache
 from django.conf import settings
 from celery.result import AsyncResult
+from asgiref.sync import sync_to_async
 
-from .utils.text_length_calculator import calculate_length
+from .utils.analysis import analyze, get_analysis
+from .utils.pdf_preflight import message as preflight_message, preflight, REJECTED_KINDS
+from .utils.cost_estimator import estimate_cost
 from .utils.price_calculator import calculate_price
 from .forms import UploadFileForm
-from .tasks import translate_file_task
+from .tasks import translate_file_task, translate_file_batch_task
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from wallet.models import UserWallet
 from documents.models import Document
 from django.utils import timezone
@@ -39,7 +46,11 @@ def upload_file(request):
     """
 
 
-    return render(request, "translate/upload.html")
+    # Import here to avoid circular imports
+    from .events import EVENTS_HEARTBEAT
+
+    # The page gives up on a silent event stream after about one heartbeat
+    return render(request, "translate/upload.html", {'events_heartbeat_ms': int(EVENTS_HEARTBEAT * 1000)})
 
 
 
@@ -137,12 +148,23 @@ def chunked_upload(request):
                     return JsonResponse({
                         'error': f'The file format does not match its extension. Expected {ext} file but got {mime}.'
                     }, status=400)
+
+                # Turn away scanned or unreadable PDFs before pricing and queuing
+                checked = preflight(abs_path) if ext == '.pdf' else None
+                if checked and checked['kind'] in REJECTED_KINDS:
+                    os.unlink(abs_path)
+                    return JsonResponse({'error': preflight_message(checked), 'pdf_kind': checked['kind']},
+                                        status=422)
+
+                # Extract once now; pricing, charging and the task reuse it
+                analyze(abs_path, preflight=checked)
                 
                 return JsonResponse({
                     'success': True,
                     'message': 'File upload completed',
                     'file_path': rel_path,
-                    'completed': True
+                    'completed': True,
+                    'warning': preflight_message(checked),
                 })
                 
             except Exception as e:
@@ -184,6 +206,8 @@ def start_translate(request):
             return JsonResponse({'error':'File could not found'})
         source_lang = request.POST.get("source_language")
         target_lang = request.POST.get("target_language")
+        # "economy" trades turnaround (up to 24h) for Batch API pricing on CSV/XLSX
+        mode = request.POST.get("mode", "standard")
 
         if not all([source_lang, target_lang]):
             return JsonResponse({'error':'Some parameters are missing :('}, status=400)
@@ -196,7 +220,12 @@ def start_translate(request):
         if not os.path.exists(abs_path):
             return JsonResponse({'error': 'Uploaded file not found on server'}, status=404)
 
-        text_length = calculate_length(abs_path)
+        analysis = get_analysis(abs_path)
+        checked = analysis.get("preflight")
+        if checked and checked["kind"] in REJECTED_KINDS:
+            # never charge for a file the worker cannot translate
+            return JsonResponse({'error': preflight_message(checked), 'pdf_kind': checked['kind']}, status=422)
+        text_length = analysis["text_length"]
         price = calculate_price(text_length)["price"]
         price = Decimal(str(price))
 
@@ -225,7 +254,7 @@ def start_translate(request):
                 )
 
                 # Start translation task directly since file is already saved
-                task_id = start_translation_task(abs_path, source_lang, target_lang)
+                task_id = start_translation_task(abs_path, source_lang, target_lang, mode)
                 document.task_id = task_id
                 document.save()
 
@@ -243,7 +272,7 @@ def start_translate(request):
         return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
 
 
-def start_translation_task(file_path, source_language, target_language):
+def start_translation_task(file_path, source_language, target_language, mode="standard"):
     """
     Start Celery translation task
     """
@@ -253,6 +282,9 @@ def start_translation_task(file_path, source_language, target_language):
     tmp_out_path = os.path.join(os.path.dirname(file_path), f"{base_name}.{target_language[:2]}{ext}")
     
     # Start Celery task
+    if mode == "economy":
+        task = translate_file_batch_task.delay(str(file_path), str(tmp_out_path), source_language, target_language)
+        return task.id
     task = translate_file_task.delay(str(file_path), str(tmp_out_path), source_language, target_language)
     return task.id
 
@@ -300,15 +332,25 @@ def direct_upload(request):
                     'error': f'The file format does not match its extension. Expected {ext} file but got {mime}.'
                 }, status=400)
                 
+            # Turn away scanned or unreadable PDFs before pricing and queuing
+            checked = preflight(temp_path) if ext == '.pdf' else None
+            if checked and checked['kind'] in REJECTED_KINDS:
+                os.unlink(temp_path)
+                return JsonResponse({'error': preflight_message(checked), 'pdf_kind': checked['kind']}, status=422)
+
             # If validation passes, save the file
             file_name = getattr(uploaded_file, 'name', 'uploaded_file')
             file_path = default_storage.save(f"uploads/{file_name}", ContentFile(open(temp_path, 'rb').read()))
             os.unlink(temp_path)
+
+            # Extract once now; pricing, charging and the task reuse it
+            analyze(default_storage.path(file_path), preflight=checked)
             
             return JsonResponse({
                 'success': True,
                 'message': 'File uploaded successfully',
-                'file': file_path
+                'file': file_path,
+                'warning': preflight_message(checked),
             })
             
         except Exception as e:
@@ -335,11 +377,15 @@ def get_price(request):
     if not os.path.exists(full_path):
         return JsonResponse({'error': 'File not found'}, status=404)
 
-    text_length = calculate_length(full_path)
+    text_length = get_analysis(full_path)["text_length"]
     price = calculate_price(text_length)["price"]
+    # Expected requests and tokens, for judging real API cost and job size
+    estimate = estimate_cost(full_path, request.POST.get("source_language") or "English",
+                             request.POST.get("target_language") or "Turkish")
 
     return JsonResponse({
         'price': price,
+        'estimate': estimate,
         'message': 'Estimated fee/price for the document that uploaded',
         'file': (os.path.relpath(full_path, settings.MEDIA_ROOT) if not os.path.isabs(filepath) else filepath), 
 
@@ -367,17 +413,17 @@ def download_file(request, task_id: str):
     return FileResponse(open(out_path, "rb"), as_attachment=True, filename=filename)
 
 
-@require_http_methods(["GET"])
-def ajax_task_status(request, task_id: str):
+def _task_status(task_id: str):
     """
-    AJAX endpoint for checking task status
+    Status payload and HTTP status of a translation task; records the
+    outcome on its Document once the task has finished
     """
     res = AsyncResult(task_id)
     
     try:
         document = Document.objects.get(task_id=task_id)
     except Document.DoesNotExist:
-        return JsonResponse({'error': 'Document not found'}, status=404)
+        return {'error': 'Document not found'}, 404
     
     if res.failed():
         document.status = 'failed'
@@ -388,17 +434,19 @@ def ajax_task_status(request, task_id: str):
         if "Invalid MIME" in error_message:
             error_message = "The file format doesn't match its extension. Please make sure you're uploading a valid file."
             
-        return JsonResponse({
+        return {
             'status': 'FAILURE',
             'error': error_message
-        }, status=500)
+        }, 500
     
     if not res.ready():
-        return JsonResponse({
+        # Batches/segments done and total, published by translate_file_task
+        progress = res.info if res.state == 'PROGRESS' and isinstance(res.info, dict) else None
+        return {
             'status': 'PENDING',
             'message': 'Processing…',
-            'progress': None  # You can add progress tracking if your task supports it
-        })
+            'progress': progress
+        }, 200
     
     # Update document status and translated file path
     document.status = 'completed'
@@ -411,9 +459,91 @@ def ajax_task_status(request, task_id: str):
     document.completed_at = timezone.now()
     document.save()
     
-    return JsonResponse({
+    return {
         'status': 'SUCCESS',
         'message': 'Translation completed',
         'download_url': f'/upload/download/{task_id}/'
-    })
+    }, 200
+
+
+@require_http_methods(["GET"])
+def ajax_task_status(request, task_id: str):
+    """
+    AJAX endpoint for checking task status
+    """
+    payload, status = _task_status(task_id)
+    return JsonResponse(payload, status=status)
+
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@login_required
+@require_http_methods(["GET"])
+async def task_events(request, task_id: str):
+    """
+    Server-Sent Events stream of a task's status, pushed from Redis pub/sub.
+
+    Sends the current status first, then one event per state change, with a
+    heartbeat event every EVENTS_HEARTBEAT seconds in between, and ends after
+    SUCCESS/FAILURE. Only served over ASGI (see translator/asgi.py): a WSGI
+    server would buffer the whole stream, so there it answers 204 and
+    clients poll ajax_task_status instead, as they do when the stream breaks.
+    """
+    # Import here to avoid circular imports
+    from . import events
+
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    # Subscribe before reading the current state so no transition is missed
+    try:
+        client, pubsub = await events.subscribe(task_id)
+    except Exception as e:
+        print(f"Task event stream unavailable for {task_id}: {e}")
+        return JsonResponse({'error': 'Event stream unavailable'}, status=503)
+
+    async def stream():
+        try:
+            payload, _ = await sync_to_async(_task_status)(task_id)
+            yield _sse(payload)
+            if payload.get('status') != 'PENDING':
+                return
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + events.EVENTS_MAX_STREAM
+            while loop.time() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=events.EVENTS_HEARTBEAT)
+                if message is None:
+                    # a named event, not a comment, so the page sees the stream is alive
+                    yield "event: heartbeat\ndata: {}\n\n"
+                    continue
+                event = json.loads(message['data'])
+                if event['state'] == 'PROGRESS':
+                    yield _sse({'status': 'PENDING', 'message': 'Processing…', 'progress': event['progress']})
+                elif event['state'] in events.TERMINAL_STATES:
+                    payload, _ = await sync_to_async(_task_status)(task_id)
+                    yield _sse(payload)
+                    return
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def llm_rate_status(request):
+    """
+    Live utilization of the cluster-wide LLM rate governor
+    """
+    from .translators.rate_limit import get_governor
 
+    governor = get_governor()
+    if governor is None:
+        return JsonResponse({'enabled': False})
+    return JsonResponse({'enabled': True, **governor.utilization()})
@@ -3,6 +3,11 @@ ASGI config for translator project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn translator.asgi:application``) to
+get pushed job status: the async ``task_events`` view streams each task's
+state changes as Server-Sent Events from Redis pub/sub. Under WSGI the upload
+page falls back to polling ``ajax_task_status``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -1,9 +1,93 @@
 import os
-from celery import Celery
+from celery import bootsteps, Celery
+from celery.signals import celeryd_init, worker_process_init
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "translator.settings")
 
 app = Celery("translator")
 app.config_from_object('django.conf:settings', namespace="CELERY")
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@celeryd_init.connect
+def configure_queue_worker(sender=None, instance=None, conf=None, options=None, **kwargs):
+    """Apply the TRANSLATE_QUEUES profile of a worker dedicated to one queue.
+
+    Sets pool concurrency (unless -c was given), prefetch (unless
+    --prefetch-multiplier was given) and time limits, e.g.
+    `celery --app translator.celery_app worker -Q pdf-heavy`. Workers
+    consuming several translation queues keep the Celery defaults.
+
+    `options` is a copy, so changing it has no effect. Concurrency and the
+    time limits go through the configuration, which the worker reads when
+    they were not given. The command line always fills in the prefetch
+    multiplier, so it is handed to QueueProfilePrefetch on the worker instead.
+    """
+    from django.conf import settings
+
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    queues = [q.strip() for q in queues]
+    warm_pdf_engine(queues, options.get("pool_cls"))
+
+    profiles = [settings.TRANSLATE_QUEUES[q] for q in queues if q in settings.TRANSLATE_QUEUES]
+    if len(profiles) != 1:
+        return
+    profile = profiles[0]
+    if not options.get("concurrency"):
+        conf.worker_concurrency = profile["concurrency"]
+    # an unset --prefetch-multiplier arrives as the configured value
+    if instance is not None and options.get("prefetch_multiplier") in (None, conf.worker_prefetch_multiplier):
+        instance.profile_prefetch_multiplier = profile["prefetch_multiplier"]
+    conf.task_soft_time_limit = profile["soft_time_limit"]
+    conf.task_time_limit = profile["time_limit"]
+
+
+class QueueProfilePrefetch(bootsteps.Step):
+    """Sets the queue profile's prefetch multiplier (see configure_queue_worker).
+
+    Steps are built before the consumer reads the worker's prefetch, and
+    after setup_defaults has copied the command-line value onto it.
+    """
+
+    def __init__(self, worker, **kwargs):
+        prefetch = getattr(worker, "profile_prefetch_multiplier", None)
+        if prefetch is not None:
+            worker.prefetch_multiplier = prefetch
+        super().__init__(worker, **kwargs)
+
+
+app.steps["worker"].add(QueueProfilePrefetch)
+
+
+def warm_pdf_engine(queues, pool):
+    """Preload the PDF engine in the worker's main process (see pdf_engine).
+
+    Prefork children build their own layout model in worker_process_init;
+    solo/threads pools run jobs in this process, so it is built here.
+    """
+    from translate.translators import pdf_engine
+
+    if not pdf_engine.wanted(queues):
+        return
+    try:
+        pdf_engine.preload_parent()
+        pool_name = getattr(pool, "__name__", str(pool or "prefork")).lower()
+        if "solo" in pool_name or "thread" in pool_name:
+            pdf_engine.load_models()
+    except Exception as e:
+        print(f"[PDF engine] preload failed, PDFs will load models per job: {e}")
+
+
+@worker_process_init.connect
+def load_pdf_models(**kwargs):
+    from translate.translators import pdf_engine
+
+    if not pdf_engine.is_preloaded():
+        return
+    try:
+        pdf_engine.load_models()
+    except Exception as e:
+        print(f"[PDF engine] model load failed, PDFs will load models per job: {e}")
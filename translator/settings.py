@@ -78,6 +78,20 @@ CELERY_RESULT_BACKEND = "redis://127.0.0.1:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
+# Translation jobs are routed to a queue by format and estimated size
+# (translate/routing.py), so small files never wait behind PDFs
+CELERY_TASK_ROUTES = ("translate.routing.route_task",)
+
+# Worker profile per queue, applied to workers started with -Q <queue>
+# (translator/celery.py). max_chars: larger jobs go to the bulk queue instead.
+TRANSLATE_QUEUES = {
+    "fast-tabular": {"max_chars": int(os.environ.get("FAST_TABULAR_MAX_CHARS", "200000")),
+                     "concurrency": 8, "prefetch_multiplier": 4, "soft_time_limit": 600, "time_limit": 660},
+    "docx": {"max_chars": int(os.environ.get("DOCX_QUEUE_MAX_CHARS", "2000000")),
+             "concurrency": 4, "prefetch_multiplier": 1, "soft_time_limit": 3600, "time_limit": 3720},
+    "pdf-heavy": {"concurrency": 1, "prefetch_multiplier": 1, "soft_time_limit": 4 * 3600, "time_limit": 4 * 3600 + 300},
+    "bulk": {"concurrency": 4, "prefetch_multiplier": 1, "soft_time_limit": 4 * 3600, "time_limit": 4 * 3600 + 300},
+}
 
 USE_I18N = True
 USE_L10N = True